@@ -0,0 +1,82 @@
+"""
+per entry cost of (de)serializing cached responses
+
+compares building a pure python protocol over a new buffer for every
+entry (what the cache used to do) to the handler's accelerated path,
+for pages of typical sizes.
+
+    python benchmarks/cache_serialization.py [iterations]
+"""
+
+import os
+import sys
+import random
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from tgen.requester import ttypes as o
+from handlers.requester import CachingRequestHandler, fastbinary
+
+SIZES = (50 * 1024, 200 * 1024, 1024 * 1024)
+
+
+def make_response(size):
+    words = ['<div>', '</div>', 'lorem', 'ipsum', 'dolor', 'href="/a/b"']
+    content = ' '.join(random.choice(words) for i in xrange(size / 5))
+    headers = dict(('x-header-%s' % i, 'value %s' % i) for i in xrange(15))
+    headers['content-type'] = 'text/html; charset=utf-8'
+    headers['cache-control'] = 'max-age=300'
+    return o.Response(url='http://example.com/some/page', status_code=200,
+                      headers=headers, content=content[:size],
+                      timestamp=time(), response_time=0.25,
+                      cookies={'session': 'abc123'})
+
+
+def before_serialize(obj):
+    trans = TTransport.TMemoryBuffer()
+    obj.write(TBinaryProtocol.TBinaryProtocol(trans))
+    return trans.getvalue()
+
+
+def before_deserialize(objtype, data):
+    ret = objtype()
+    ret.read(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(data)))
+    return ret
+
+
+def timed(fn, iterations, *args):
+    """ returns the average ms per call """
+    s = time()
+    for i in xrange(iterations):
+        fn(*args)
+    return (time() - s) * 1000 / iterations
+
+
+def run():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    handler = CachingRequestHandler()
+
+    print 'fastbinary: %s' % ('yes' if fastbinary else 'no')
+    print '%8s %12s %12s %12s %12s' % ('size', 'write before',
+                                       'write after', 'read before',
+                                       'read after')
+    for size in SIZES:
+        response = make_response(size)
+        data = handler._serialize_o(response)
+        assert before_serialize(response) == data
+        assert handler._deserialize_o(o.Response, data) == response
+
+        print '%7sK %10.3fms %10.3fms %10.3fms %10.3fms' % (
+            size / 1024,
+            timed(before_serialize, iterations, response),
+            timed(handler._serialize_o, iterations, response),
+            timed(before_deserialize, iterations, o.Response, data),
+            timed(handler._deserialize_o, iterations, o.Response, data))
+
+if __name__ == '__main__':
+    run()
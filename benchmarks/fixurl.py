@@ -0,0 +1,102 @@
+"""
+cost of fixurl over a crawl's worth of urls
+
+compares fixurl as it was (parse and re-quote every time) to the
+current one w/ it's fast path for urls which need no fixing and it's
+memo of fixed urls. the corpus revisits it's hosts and paths like a
+crawl would: mostly plain urls, some w/ escapes / spaces / unicode.
+
+    python benchmarks/fixurl.py [# of urls] [# of distinct urls]
+"""
+
+import os
+import sys
+import random
+import urllib
+import urlparse
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from lib import helpers
+
+
+def before_fixurl(url):
+    """ fixurl as it was """
+    if not isinstance(url,unicode):
+        url = url.decode('utf8')
+    parsed = urlparse.urlsplit(url)
+    userpass,at,hostport = parsed.netloc.partition('@')
+    user,colon1,pass_ = userpass.partition(':')
+    host,colon2,port = hostport.partition(':')
+    scheme = parsed.scheme.encode('utf8')
+    user = urllib.quote(user.encode('utf8'))
+    colon1 = colon1.encode('utf8')
+    pass_ = urllib.quote(pass_.encode('utf8'))
+    at = at.encode('utf8')
+    host = host.encode('idna')
+    colon2 = colon2.encode('utf8')
+    port = port.encode('utf8')
+    path = '/'.join(
+        urllib.quote(urllib.unquote(pce).encode('utf8'),'')
+        for pce in parsed.path.split('/')
+    )
+    query = urllib.quote(urllib.unquote(parsed.query).encode('utf8'),'=&?/')
+    fragment = urllib.quote(urllib.unquote(parsed.fragment).encode('utf8'))
+    netloc = ''.join((user,colon1,pass_,at,host,colon2,port))
+    return urlparse.urlunsplit((scheme,netloc,path,query,fragment))
+
+
+HOSTS = ['www.example.com', 'news.example.org', 'shop.example.net:8080',
+         'cdn.example.com', 'blog.example.io']
+WORDS = ['index.html', 'articles', '2012', 'some-page', 'a_b', 'item',
+         'search', 'img.png', 'category', 'p']
+ODD = [' spaced out', '%7Euser', 'caf\xc3\xa9', 'a+b', '~tilde', '%2fslash']
+
+
+def make_url():
+    path = '/'.join(random.choice(WORDS) for i in xrange(random.randint(1, 4)))
+    roll = random.random()
+    if roll < 0.1:
+        path += '/' + random.choice(ODD)
+    url = 'http://%s/%s' % (random.choice(HOSTS), path)
+    if random.random() < 0.4:
+        url += '?id=%s&page=%s' % (random.randint(1, 500),
+                                   random.randint(1, 20))
+    if roll > 0.95:
+        url += '#section-%s' % random.randint(1, 5)
+    return url
+
+
+def timed(fn, urls):
+    s = time()
+    for url in urls:
+        fn(url)
+    return time() - s
+
+
+def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    random.seed(1)
+    corpus = [make_url() for i in xrange(distinct)]
+    urls = [random.choice(corpus) for i in xrange(count)]
+
+    # the hosts are plain, nothing should come out different
+    for url in corpus:
+        assert helpers.fixurl(url) == before_fixurl(url), url
+    helpers.fixed_urls.clear()
+    helpers.encoded_hosts.clear()
+
+    safe = sum(1 for url in corpus if helpers.SAFE_URL.match(url))
+    print '%s urls, %s distinct, %s%% need no fixing' % (
+        count, distinct, safe * 100 / distinct)
+    before = timed(before_fixurl, urls)
+    after = timed(helpers.fixurl, urls)
+    print 'before: %.3fs  %.2fus / url' % (before, before * 1e6 / count)
+    print 'after:  %.3fs  %.2fus / url' % (after, after * 1e6 / count)
+
+if __name__ == '__main__':
+    run()
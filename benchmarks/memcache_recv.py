@@ -0,0 +1,129 @@
+"""
+cost of reading a get reply off a memcached connection
+
+compares the string buffer _Host used to keep (grown w/ += and
+sliced on every read) to the bytearray / recv_into buffer, for values
+of typical cached page sizes. the socket is faked, handing out at most
+16KB per call like a busy TCP connection would.
+
+    python benchmarks/memcache_recv.py [iterations]
+"""
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import memcache
+
+SIZES = (50 * 1024, 200 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+SEGMENT = 16 * 1024
+
+
+class FakeSocket(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def recv(self, size):
+        size = min(size, SEGMENT)
+        data = self.data[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def recv_into(self, view, size=0):
+        size = min(size or len(view), len(view), SEGMENT,
+                   len(self.data) - self.offset)
+        # straight in to the view, like the kernel would
+        view[:size] = buffer(self.data, self.offset, size)
+        self.offset += size
+        return size
+
+
+class BeforeHost(object):
+    """ _Host's reads as they were """
+
+    def __init__(self, sock):
+        self.socket = sock
+        self.buffer = ''
+
+    def readline(self):
+        buf = self.buffer
+        recv = self.socket.recv
+        while True:
+            index = buf.find('\r\n')
+            if index >= 0:
+                break
+            data = recv(4096)
+            if not data:
+                return ''
+            buf += data
+        self.buffer = buf[index+2:]
+        return buf[:index]
+
+    def recv(self, rlen):
+        self_socket_recv = self.socket.recv
+        buf = self.buffer
+        while len(buf) < rlen:
+            foo = self_socket_recv(max(rlen - len(buf), 4096))
+            buf += foo
+        self.buffer = buf[rlen:]
+        return buf[:rlen]
+
+    def read_value(self):
+        line = self.readline()
+        rlen = int(line.split()[3])
+        value = self.recv(rlen + 2)[:-2]
+        self.readline()
+        return value
+
+
+def after_host(sock):
+    host = memcache._Host('127.0.0.1:11211')
+    host.socket = sock
+    return host
+
+
+def after_read_value(host):
+    line = host.readline()
+    value = host.recv_value(int(line.split()[3]))
+    host.readline()
+    return value
+
+
+def reply(size):
+    return 'VALUE httpcache:key 0 %d\r\n%s\r\nEND\r\n' % (size, 'x' * size)
+
+
+def timed(make, read, iterations, data):
+    """ returns the average ms per read, over one connection """
+    host = make(None)
+    total = 0
+    for i in xrange(iterations):
+        host.socket = FakeSocket(data)
+        s = time()
+        read(host)
+        total += time() - s
+    return total * 1000 / iterations
+
+
+def run():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    before = (BeforeHost, BeforeHost.read_value)
+    after = (after_host, after_read_value)
+
+    print '%8s %12s %12s' % ('size', 'before', 'after')
+    for size in SIZES:
+        data = reply(size)
+        assert (BeforeHost(FakeSocket(data)).read_value()
+                == after_read_value(after_host(FakeSocket(data))))
+        print '%7sK %10.3fms %10.3fms' % (size / 1024,
+                                          timed(*before + (iterations, data)),
+                                          timed(*after + (iterations, data)))
+
+if __name__ == '__main__':
+    run()
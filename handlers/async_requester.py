@@ -0,0 +1,65 @@
+"""
+the requester handler w/ cooperative io, for lots of concurrent calls
+
+gevent's monkey patching turns the handler's blocking io (requests,
+memcached and redis sockets, the rate limit waits and the threads
+the fetch engine and scheduler use) in to greenlets which yield while
+they wait. one process can then have thousands of urlopen calls in
+flight w/o a thread for each. the patching has to happen before
+anything else is imported, so run this module, not handlers.requester.
+
+    python -m handlers.async_requester --port 9090
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+from tgen.requester import Requester
+from handlers.requester import MatureRequestHandler
+
+
+class AsyncMatureRequestHandler(MatureRequestHandler):
+
+    # greenlets are cheap, what bounds us now are the hosts' limits
+    fetch_workers = 2000
+
+    # calls waiting on memcached share it's connections
+    memcache_max_connections = 256
+
+    max_streams = 1000
+
+
+def run():
+    from optparse import OptionParser
+    from lib.server import serve, serve_prefork
+
+    parser = OptionParser()
+    parser.add_option('--host', default='0.0.0.0')
+    parser.add_option('--port', type='int', default=9090)
+    parser.add_option('--max-connections', type='int', default=5000,
+                      help='client connections served at once, '
+                           '0 for no limit')
+    parser.add_option('--processes', type='int', default=0,
+                      help='pre-fork this many processes sharing the '
+                           'listening socket')
+    parser.add_option('--max-requests', type='int', default=0,
+                      help='replace a process after it handles this '
+                           'many calls, 0 to keep it forever')
+    parser.add_option('--graceful-timeout', type='int', default=30,
+                      help="seconds a process has to finish it's calls "
+                           "when it's replaced or stopped")
+    options, args = parser.parse_args()
+
+    if options.processes:
+        serve_prefork(Requester, AsyncMatureRequestHandler, options.host,
+                      options.port, 'gevent', options.max_connections, 0,
+                      options.processes, options.max_requests,
+                      options.graceful_timeout)
+        return
+
+    handler = AsyncMatureRequestHandler()
+    serve(Requester, handler, options.host, options.port,
+          'gevent', options.max_connections)
+
+if __name__ == '__main__':
+    run()
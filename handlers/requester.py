@@ -1,19 +1,35 @@
 from tgen.requester import Requester, ttypes as o
 
-import requests
-from lib.helpers import fixurl
+from lib.helpers import fixurl, canonical_url
 from time import time, sleep
 import random
+import threading
+from uuid import uuid4
+from copy import copy
 
 from thrift.protocol import TBinaryProtocol
 from thrift.transport import TTransport
+from thrift.Thrift import TType
+try:
+    from thrift.protocol import fastbinary
+except ImportError:
+    fastbinary = None
 
 from hashlib import sha1
 from redis import Redis
 import memcache
 from urlparse import urlparse
+import urllib
 
-from lib.ratelimiter import RateLimiter
+from lib.hostlimiter import HostRateLimiter
+from lib.fetcher import FetchEngine
+from lib.sessions import SessionPool
+from lib.lrucache import LRUCache
+from lib.singleflight import SingleFlight
+from lib.scheduler import RateScheduler
+from lib.tokenbucket import LeasedRateLimiter
+from lib import httpcache
+from lib import compression
 
 class RequestHandler(object):
     def __init__(self):
@@ -25,21 +41,59 @@ class RequestHandler(object):
         """
         raise NotImplementedError
 
-    def cache_urlopen(self, request):
+    def urlopen_multi(self, requests):
+        """
+        returns a BatchResponse for each request, in order
+        """
+        raise NotImplementedError
+
+    def cache_urlopen(self, request, read_stale=True):
         """
         returns a response if it's in the cache
         """
         raise NotImplementedError
 
+    def cache_urlopen_meta(self, request):
+        """
+        returns a cached response w/o it's content
+        """
+        raise NotImplementedError
+
+    def cache_urlopen_multi(self, requests):
+        """
+        returns a response or None for each request, in order
+        """
+        raise NotImplementedError
+
     def set_cache(self, request, response):
         """
         updates the cache w/ the given response
         """
         raise NotImplementedError
 
-    def live_urlopen(self, request):
+    def refresh_cache(self, request, response):
+        """
+        updates the cache w/ a response which was revalidated
+        """
+        raise NotImplementedError
+
+    def live_urlopen(self, request, headers=None):
+        """
+        makes request to host and returns response, sending
+        any extra headers given
+        """
+        raise NotImplementedError
+
+    def urlopen_stream(self, request):
         """
-        makes request to host and returns response
+        makes request to host and returns response w/o it's
+        content, which is read w/ read_stream
+        """
+        raise NotImplementedError
+
+    def read_stream(self, stream_id, max_bytes):
+        """
+        returns the next chunk of the stream's content
         """
         raise NotImplementedError
 
@@ -56,106 +110,853 @@ class RequestHandler(object):
         """
         raise NotImplementedError
 
+    def shutdown(self):
+        """
+        called before the process exits, pushes out anything
+        other processes need to see
+        """
+        pass
+
 class LiveRequestHandler(RequestHandler):
 
     timeout = 30
     user_agent = 'Mozilla/5.0 (Windows NT 5.1) AppleWebKit/535.6 (KHTML, like Gecko) Chrome/16.0.897.0 Safari/535.6'
 
+    # how many fetches we'll keep in flight, total and per host
+    fetch_workers = 200
+    max_fetches_per_host = 4
+
+    # keep-alive connections we hold open per host, and how
+    # long an unused host's connections are kept around
+    max_connections_per_host = 4
+    session_idle_timeout = 60
+
+    methods = ('get', 'head', 'post', 'put', 'patch', 'delete', 'options')
+
+    # bodies are read this much at a time, anything past the max
+    # body size is dropped and the response marked truncated
+    read_chunk_size = 64 * 1024
+    max_body_size = 50 * 1024 * 1024
+
+    # open streams, how long one can go unread before we close it and
+    # how often we look for those
+    max_streams = 100
+    stream_idle_timeout = 60
+    stream_sweep_interval = 10
+    # most a read_stream call returns, whatever the client asks for
+    max_stream_read = 1024 * 1024
+
+    def __init__(self):
+        self.fetcher = FetchEngine(self.fetch_workers,
+                                   self.max_fetches_per_host)
+        self.sessions = SessionPool(self.max_connections_per_host,
+                                    self.session_idle_timeout)
+
+        # stream id -> [request, requests response, content iterator,
+        #               buffered data, bytes read, last read, lock]
+        # the stream's lock is held while it's read or closed
+        self.streams = {}
+        self.streams_lock = threading.Lock()
+
+        self.stream_sweeper = threading.Thread(
+            target=self._close_idle_streams_forever, name='stream-sweep')
+        self.stream_sweeper.daemon = True
+        self.stream_sweeper.start()
+
     def urlopen(self,request):
         return self.live_urlopen(request)
 
-    def live_urlopen(self, request):
+    def submit_live(self, request, fn, *args):
+        """
+        runs fn on the fetch engine under the request's host limit,
+        returns a FetchFuture for it's result
+        """
+        host = urlparse(request.url).netloc.lower()
+        return self.fetcher.submit(host, fn, *args)
+
+    def live_urlopen(self, request, headers=None):
         s = time()
 
-        method = request.method or 'get'
+        http_response = self._open_live(request, headers)
+        response = self._build_response(http_response, s)
+
+        # read the body, giving up past the max size
+        chunks = []
+        size = 0
         try:
-            getter = getattr(requests,method)
-        except AttributeError, ex:
+            for chunk in self._iter_body(http_response):
+                if size + len(chunk) > self.max_body_size:
+                    chunks.append(chunk[:self.max_body_size - size])
+                    response.truncated = True
+                    print 'truncated response: %s' % request.url
+                    self._discard(http_response)
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        except Exception, ex:
+            raise o.Exception('HTTP Request Error: %s' % ex)
+
+        if http_response.raw is not None:
+            response.content = ''.join(chunks)
+        response.response_time = (time() - s)
+
+        # and we're done!
+        return response
+
+    def urlopen_stream(self, request):
+        s = time()
+        self._close_idle_streams()
+
+        with self.streams_lock:
+            if len(self.streams) >= self.max_streams:
+                raise o.Exception('Too many open streams')
+
+        http_response = self._open_live(request)
+        response = self._build_response(http_response, s)
+
+        response.stream_id = uuid4().hex
+        with self.streams_lock:
+            self.streams[response.stream_id] = [
+                request, http_response, self._iter_body(http_response),
+                '', 0, time(), threading.Lock()]
+        return response
+
+    def read_stream(self, stream_id, max_bytes):
+        with self.streams_lock:
+            stream = self.streams.get(stream_id)
+        if not stream:
+            raise o.Exception('Unknown stream: %s' % stream_id)
+
+        with stream[6]:
+            # it may have ended or been closed while we waited
+            with self.streams_lock:
+                if self.streams.get(stream_id) is not stream:
+                    raise o.Exception('Unknown stream: %s' % stream_id)
+            stream[5] = time()
+            return self._read_stream(stream_id, stream, max_bytes)
+
+    def _read_stream(self, stream_id, stream, max_bytes):
+        # the stream's lock is held
+        max_bytes = min(max(1, max_bytes or self.read_chunk_size),
+                        self.max_stream_read)
+        body, data = stream[2:4]
+
+        # read until we have enough or the body is done
+        eof = False
+        try:
+            while len(data) < max_bytes:
+                chunk = next(body, None)
+                if chunk is None:
+                    eof = True
+                    break
+                data += chunk
+        except Exception, ex:
+            self._close_stream(stream_id)
+            raise o.Exception('HTTP Request Error: %s' % ex)
+
+        data, stream[3] = data[:max_bytes], data[max_bytes:]
+        eof = eof and not stream[3]
+        stream[4] += len(data)
+        stream[5] = time()
+
+        if eof:
+            self._close_stream(stream_id)
+        return o.StreamChunk(stream_id=stream_id, data=data, eof=eof)
+
+    def _open_live(self, request, headers=None):
+        """
+        sends the request to the host, returning the requests response
+        w/ it's body still waiting to be read
+        """
+        method = (request.method or 'get').lower()
+        if method not in self.methods:
             raise o.Exception('Bad method: %s' % method)
 
+        request_headers = {'User-Agent':self.user_agent}
+        request_headers.update(headers or {})
+
         try:
-            # use the requests getter to get the resource
-            http_response = getter(request.url,
-                                   cookies=request.cookies,
-                                   timeout=self.timeout,
-                                   headers={'User-Agent':self.user_agent},
-                                   # don't just get headers
-                                   prefetch=True,
-                                   # we want raw data, not unicode
-                                   config={'decode_unicode':False})
+            # use the origin's keep-alive session to get the resource
+            with self.sessions.checkout(request.url) as session:
+                getter = getattr(session,method)
+                http_response = getter(request.url,
+                                       cookies=request.cookies,
+                                       timeout=self.timeout,
+                                       headers=request_headers,
+                                       # we read the body ourselves
+                                       prefetch=False,
+                                       # we want raw data, not unicode
+                                       config={'decode_unicode':False})
         except Exception, ex:
             # problem actually trying to get the resource
             raise o.Exception('HTTP Request Error: %s' % ex)
+        return http_response
 
+    def _build_response(self, http_response, s):
         # build our response obj / aka copy that shit
         response = o.Response()
         response.status_code = http_response.status_code
         response.url = fixurl(http_response.url)
-        response.headers = http_response.headers
-        response.content = http_response.content
+        # plain dicts, the accelerated protocol won't encode anything else
+        response.headers = dict(http_response.headers or {})
         response.timestamp = time()
         response.response_time = (time() - s)
-        response.cookies = http_response.cookies
-
-        # and we're done!
+        response.cookies = dict(http_response.cookies or {})
         return response
 
+    def _iter_body(self, http_response):
+        if http_response.raw is None:
+            return iter(())
+        return http_response.iter_content(self.read_chunk_size)
+
+    def _discard(self, http_response):
+        """
+        drops the rest of the body, closing the connection since
+        it can't be reused w/ unread data on it
+        """
+        fp = getattr(http_response.raw, '_fp', None)
+        if fp is not None:
+            fp.close()
+
+    def _close_stream(self, stream_id):
+        # the stream's lock is held
+        with self.streams_lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream:
+            self._discard(stream[1])
+            self.stream_closed(stream[0], stream[4])
+
+    def _close_idle_streams(self):
+        give_up = time() - self.stream_idle_timeout
+        with self.streams_lock:
+            idle = [(k, v) for k, v in self.streams.iteritems()
+                    if v[5] < give_up]
+        for stream_id, stream in idle:
+            # one being read isn't idle
+            if not stream[6].acquire(False):
+                continue
+            try:
+                if stream[5] >= give_up:
+                    # read since we looked
+                    continue
+                print 'closing idle stream: %s' % stream_id
+                self._close_stream(stream_id)
+            finally:
+                stream[6].release()
+
+    def _close_idle_streams_forever(self):
+        while True:
+            sleep(self.stream_sweep_interval)
+            try:
+                self._close_idle_streams()
+            except Exception, ex:
+                print 'closing idle streams failed: %s' % ex
+
+    def stream_closed(self, request, size):
+        """ called w/ the bytes read once a stream is done """
+        pass
+
 class CachingRequestHandler(RequestHandler):
+
+    # bounds on the in process (L1) cache in front of memcached
+    l1_max_entries = 10000
+    l1_max_bytes = 64 * 1024 * 1024
+
+    # how long past going stale we keep a response that can be
+    # revalidated w/ a conditional request
+    revalidate_window = 60 * 60 * 24
+
+    # how long past going stale we'll hand out a response while it's
+    # refreshed in the background / while it's host is failing. a
+    # response's own stale-while-revalidate / stale-if-error wins, and
+    # these only apply to responses which had a freshness lifetime
+    stale_while_revalidate = 60
+    stale_if_error = 60 * 60
+
+    # memcached reads expiries longer than 30 days as timestamps
+    max_cache_ttl = 60 * 60 * 24 * 30
+
+    # only responses to these are cached and served from the cache,
+    # anything else goes to the host and drops what we have of the url
+    cacheable_methods = ('GET', 'HEAD')
+
+    # entries bigger than this are split across several keys, it
+    # needs to stay under memcached's max item size (1MB default)
+    cache_chunk_size = 1000 * 1000
+
+    # how cached bodies are compressed, see lib.compression. bodies
+    # smaller than the threshold aren't worth it
+    cache_codec = 'zlib'
+    cache_compress_level = 6
+    cache_compress_threshold = 1024
+
+    # 'split' keeps a response's metadata and body under separate
+    # keys so metadata lookups and revalidation don't move the body,
+    # 'whole' keeps them together. either layout can be read.
+    cache_layout = 'split'
+
+    # how keys are spread across memcached servers, ketama keeps
+    # most keys where they were when servers come and go
+    memcache_distribution = 'ketama'
+
+    # memcached connections are shared by all our threads, at most
+    # this many per server (0 for no limit)
+    memcache_pooled = True
+    memcache_max_connections = 64
+
+    # 'meta' (memcached 1.6+) pipelines multi gets / sets quietly,
+    # 'text' works w/ any memcached
+    memcache_protocol = 'meta'
+
+    # cache writes are sent w/o waiting to hear they were stored,
+    # a lost write is a cache miss later
+    cache_noreply = True
+
     def __init__(self,memcached_host='127.0.0.1',memcached_port=11211):
         self.memcached_host = memcached_host
         self.memcached_port = memcached_port
         self.mc = memcache.Client(['%s:%s' %
-                            (self.memcached_host,self.memcached_port)])
-        self.pfactory = TBinaryProtocol.TBinaryProtocolFactory()
+                            (self.memcached_host,self.memcached_port)],
+                            distribution=self.memcache_distribution,
+                            pooled=self.memcache_pooled,
+                            pool_max_size=self.memcache_max_connections,
+                            protocol=self.memcache_protocol)
+        self.pfactory = TBinaryProtocol.TBinaryProtocolAcceleratedFactory()
+
+        # w/o it's module installed every cache write would fail
+        if self.cache_codec not in compression.available():
+            print 'cache codec not available, using zlib: %s' % (
+                self.cache_codec)
+            self.cache_codec = 'zlib'
+
+        # already deserialized responses, by cache key
+        self.l1 = LRUCache(self.l1_max_entries, self.l1_max_bytes)
+        self.mc_hits = 0
+        self.mc_misses = 0
 
     def urlopen(self,request):
         return self.cached_urlopen(request)
 
-    def cache_urlopen(self,request):
+    def cache_urlopen(self,request,read_stale=True):
+        """
+        returns a response if it's in the cache. w/o read_stale a
+        stale response's content isn't read if it's cached apart
+        from it's metadata, it comes back as None
+        """
+        return self._cache_get(request,
+                               lambda r: read_stale or httpcache.is_fresh(r))
+
+    def cache_urlopen_meta(self,request):
+        """
+        returns the cached response w/o reading it's content if we
+        don't already have it, None if it isn't cached
+        """
+        return self._cache_get(request, lambda r: False)
+
+    def _cache_get(self,request,read_body):
+        if not self.is_cacheable_request(request):
+            return None
+
         # check the cache
         cache_key = self.get_cache_key(request)
+
+        # our in process copy is the cheapest
+        response = self.l1.get(cache_key)
+        if self._is_vary(response):
+            cache_key = self.get_cache_key(request,response['vary'])
+            response = self.l1.get(cache_key)
+        if response:
+            return self._from_cache(response)
+
         cache_response = self.mc.get(cache_key)
+        if self._is_vary(cache_response):
+            # the response varies, ours is under the request's variant
+            self.l1.set(cache_key,cache_response,0)
+            cache_key = self.get_cache_key(request,cache_response['vary'])
+            cache_response = self.mc.get(cache_key)
+        if self._is_split(cache_response):
+            # metadata, the body is under it's own key
+            response = self._deserialize_o(o.Response,cache_response['meta'])
+            if not read_body(response):
+                self.mc_hits += 1
+                return self._from_cache(response)
+            bodies = self._get_bodies([cache_response])
+            cache_response = self._join_split(cache_response,bodies,
+                                              response)
+        elif isinstance(cache_response, dict):
+            # big entry, we got it's manifest
+            cache_response = self._join_chunked(
+                {cache_key: cache_response}).get(cache_key)
+
+        # deserialize our response
+        response = cache_response
+        if cache_response and not isinstance(cache_response, o.Response):
+            print 'got: %s' % len(cache_response)
+            response = self._unpack_response(cache_response)
 
         # no cache hit?
-        if not cache_response:
+        if not response:
+            self.mc_misses += 1
             return None # TODO: see if i can even do this
+        self.mc_hits += 1
+        self._set_l1(cache_key,response)
+        return self._from_cache(response)
 
-        print 'got: %s' % len(cache_response)
+    def cache_urlopen_multi(self,requests):
+        """ looks up all the requests w/ one trip to the cache """
+        safe = [i for i, r in enumerate(requests)
+                if self.is_cacheable_request(r)]
+        if len(safe) < len(requests):
+            # the rest are never in the cache
+            responses = [None] * len(requests)
+            found = self.cache_urlopen_multi([requests[i] for i in safe])
+            for i, response in zip(safe, found):
+                responses[i] = response
+            return responses
 
-        # deserialize our response
-        response = self._deserialize_o(o.Response,cache_response)
-        response.from_cache = True
-        return response
+        cache_keys = [self.get_cache_key(r) for r in requests]
+
+        found = {}
+        for i, cache_key in enumerate(cache_keys):
+            response = self.l1.get(cache_key)
+            if self._is_vary(response):
+                cache_key = cache_keys[i] = self.get_cache_key(
+                    requests[i],response['vary'])
+                response = self.l1.get(cache_key)
+            if response:
+                found[cache_key] = response
+
+        # whatever we don't have in process comes from memcached
+        missing = set(cache_keys) - set(found)
+        if missing:
+            cache_responses = self.mc.get_multi(missing)
+
+            # responses which vary point us at the request's
+            # variant, those come in one more trip
+            variants = set()
+            for i, cache_key in enumerate(cache_keys):
+                entry = cache_responses.get(cache_key)
+                if not self._is_vary(entry):
+                    continue
+                self.l1.set(cache_key,entry,0)
+                missing.discard(cache_key)
+                cache_keys[i] = self.get_cache_key(requests[i],entry['vary'])
+                variants.add(cache_keys[i])
+            for cache_key in set(cache_responses) - missing:
+                del cache_responses[cache_key]
+            if variants:
+                missing.update(variants)
+                cache_responses.update(self.mc.get_multi(variants))
+
+            # bodies of split entries in one more trip
+            split = dict((k, v) for k, v in cache_responses.iteritems()
+                         if self._is_split(v))
+            bodies = self._get_bodies(split.values())
+            for cache_key, entry in split.iteritems():
+                cache_responses[cache_key] = self._join_split(entry,bodies)
+
+            cache_responses = self._join_chunked(cache_responses)
+            for cache_key, cache_response in cache_responses.iteritems():
+                if not cache_response:
+                    continue
+                if isinstance(cache_response, o.Response):
+                    response = cache_response
+                else:
+                    response = self._unpack_response(cache_response)
+                    if not response:
+                        continue
+                self._set_l1(cache_key,response)
+                found[cache_key] = response
+
+            hits = len(set(found) & missing)
+            self.mc_hits += hits
+            self.mc_misses += len(missing) - hits
+
+        responses = []
+        for cache_key in cache_keys:
+            response = found.get(cache_key)
+            responses.append(response and self._from_cache(response))
+        return responses
 
     def set_cache(self,request,response):
         """ caches the response for a request """
         url = request.url
         cache_key = self.get_cache_key(request)
-        data = self._serialize_o(response)
-        self.mc.set(cache_key,data)
+
+        if not self.is_cacheable_request(request):
+            # it may have changed the resource, what we have is stale
+            if response.status_code < 400:
+                self.invalidate(url)
+            return False
+
+        # part of a body isn't worth keeping, or replacing a whole one w/
+        if response.truncated:
+            return False
+
+        ttl = self.get_cache_ttl(response)
+        if not ttl:
+            # we aren't allowed to keep it, make sure we don't. an
+            # error / a 304 says nothing about what we have though
+            if httpcache.storable_status(response.status_code):
+                self.l1.delete(cache_key)
+                self.mc.delete(cache_key,noreply=self.cache_noreply)
+            return False
+
+        vary = httpcache.vary_headers(response)
+        if vary:
+            # the request's key says where to look for it's variant,
+            # other variants may be around for longer than this one
+            marker = {'vary': vary}
+            self.mc.set(cache_key,marker,self.max_cache_ttl,
+                        noreply=self.cache_noreply)
+            self.l1.set(cache_key,marker,0)
+            cache_key = self.get_cache_key(request,vary)
+
+        if self.cache_layout == 'split':
+            if not self._store_split(cache_key,response,ttl):
+                return False
+        else:
+            data = self._pack_response(response)
+            self._store_cached(cache_key,data,ttl)
+        # replaces whatever we had in process
+        self._set_l1(cache_key,response)
         return True
 
-    def get_cache_key(self,request):
-        """ returns the key for the given request in the cache """
-        return 'httpcache:%s' % sha1(request.url).hexdigest()
+    def refresh_cache(self,request,response):
+        """
+        re-caches a response which was revalidated. if the body we
+        have cached is still around the metadata is rewritten and the
+        body kept for as long, w/o packing it again. returns the response w/ it's content, None if it's content
+        isn't cached anymore
+        """
+        cache_key = self.get_cache_key(request,
+                                       httpcache.vary_headers(response))
+        ttl = self.get_cache_ttl(response)
+        entry = self.mc.get(cache_key)
+
+        if not ttl or not self._is_split(entry):
+            if response.content is None:
+                return None
+            self.set_cache(request,response)
+            return response
+
+        if entry['body']:
+            bodies = self._get_bodies([entry])
+            cached = self._join_split(entry,bodies)
+            if not cached:
+                if response.content is None:
+                    return None
+                self.set_cache(request,response)
+                return response
+            if response.content is None:
+                response.content = cached.content
+            # the body has to last as long as the metadata now does
+            self._store_cached(entry['body'],bodies[entry['body']],ttl)
+
+        entry['meta'] = self._pack_meta(response)
+        print 'refreshing metadata: %s' % request.url
+        self.mc.set(cache_key,entry,ttl,noreply=self.cache_noreply)
+        self._set_l1(cache_key,response)
+        return response
+
+    def get_cache_ttl(self,response):
+        """
+        returns how many seconds the response should stay in the
+        cache based on it's headers, 0 if it shouldn't be cached
+        """
+        if not httpcache.is_cacheable(response):
+            return 0
+
+        ttl = httpcache.freshness_lifetime(response)
+        # keep it around past stale while we can still serve it,
+        # and if we can revalidate it
+        extra = max(httpcache.stale_window(response,
+                                           'stale-while-revalidate',
+                                           self.stale_while_revalidate),
+                    httpcache.stale_window(response, 'stale-if-error',
+                                           self.stale_if_error))
+        if httpcache.has_validators(response):
+            extra = max(extra, self.revalidate_window)
+
+        return min(ttl + extra, self.max_cache_ttl)
+
+    def cache_stats(self):
+        """ returns the hit / miss counts for each tier of the cache """
+        return {'l1': self.l1.stats(),
+                'memcached': {'hits': self.mc_hits,
+                              'misses': self.mc_misses}}
+
+    def _compress(self, content):
+        """ returns (codec id, content) compressed if it's worth it """
+        if not content or len(content) < self.cache_compress_threshold:
+            return compression.NONE, content
+        codec, packed = compression.compress(content, self.cache_codec,
+                                             self.cache_compress_level)
+        # not all content compresses
+        if len(packed) < len(content):
+            return codec, packed
+        return compression.NONE, content
+
+    def _pack_response(self, response):
+        """
+        serializes the response for the cache, compressing it's content.
+        the first byte is the id of the codec used.
+        """
+        codec, packed = self._compress(response.content)
+        if codec != compression.NONE:
+            response = copy(response)
+            response.content = packed
+        return chr(codec) + self._serialize_o(response)
+
+    def _pack_meta(self, response):
+        """ serializes the response w/o it's content """
+        meta = copy(response)
+        meta.content = None
+        meta.from_cache = None
+        return self._serialize_o(meta)
+
+    def _is_vary(self, cache_response):
+        """ returns True for the marker of a response which varies """
+        return isinstance(cache_response, dict) and 'vary' in cache_response
+
+    def _is_split(self, cache_response):
+        return isinstance(cache_response, dict) and 'meta' in cache_response
+
+    def _store_split(self, cache_key, response, ttl):
+        """
+        puts the response's metadata under the cache key and it's
+        body under a key named for the content, so responses w/ the
+        same body share it
+        """
+        entry = {'meta': self._pack_meta(response),
+                 'body': None,
+                 'length': None}
+
+        if response.content is not None:
+            entry['body'] = 'httpbody:%s' % sha1(response.content).hexdigest()
+            entry['length'] = len(response.content)
+            codec, packed = self._compress(response.content)
+            # it goes w/ the metadata, refresh_cache extends it when
+            # the metadata is rewritten
+            if not self._store_cached(entry['body'], chr(codec) + packed,
+                                      ttl):
+                return False
+
+        # write the metadata last so no one finds it before it's body.
+        # w/ noreply the body may not have landed yet, which reads
+        # like it was evicted
+        return self.mc.set(cache_key,entry,ttl,noreply=self.cache_noreply)
+
+    def _get_bodies(self, entries):
+        """ returns the bodies of the split entries by key, in one trip """
+        body_keys = set(e['body'] for e in entries if e['body'])
+        if not body_keys:
+            return {}
+        return self._join_chunked(self.mc.get_multi(body_keys))
+
+    def _join_split(self, entry, bodies, response=None):
+        """
+        returns the split entry's response w/ it's body, None if the
+        body was evicted or we can't decompress it
+        """
+        if response is None:
+            response = self._deserialize_o(o.Response,entry['meta'])
+        if entry['body']:
+            data = bodies.get(entry['body'])
+            if not data:
+                return None
+            content = self._decompress(ord(data[0]),data[1:])
+            if content is None:
+                return None
+            if len(content) != entry['length']:
+                return None
+            response.content = content
+        return response
+
+    def _unpack_response(self, data):
+        """
+        reverses _pack_response, None if we can't decompress the body
+        """
+        # entries from before compression are plain thrift, which
+        # starts w/ the url's string field header
+        if data[0] == chr(TType.STRING):
+            return self._deserialize_o(o.Response,data)
+
+        response = self._deserialize_o(o.Response,data[1:])
+        if response.content:
+            response.content = self._decompress(ord(data[0]),
+                                                response.content)
+            if response.content is None:
+                return None
+        return response
+
+    def _decompress(self, codec, data):
+        """
+        returns the cached body, None if it was written w/ a codec we
+        don't have (another process has lz4 / snappy installed) or it
+        was damaged. it reads as a miss, the refetch overwrites it
+        """
+        try:
+            return compression.decompress(codec,data)
+        except compression.CodecError, ex:
+            print 'can not read cached body: %s' % ex
+            return None
+
+    def _store_cached(self, cache_key, data, ttl):
+        """
+        puts the data in memcached, splitting it across chunk keys
+        w/ a manifest under the cache key if it's too big for one value
+        """
+        if len(data) <= self.cache_chunk_size:
+            return self.mc.set(cache_key,data,ttl,noreply=self.cache_noreply)
+
+        manifest = {'digest': sha1(data).hexdigest(),
+                    'length': len(data)}
+        manifest['chunks'] = (len(data) - 1) / self.cache_chunk_size + 1
+
+        chunk_keys = self._get_chunk_keys(cache_key,manifest)
+        chunks = {}
+        for i, chunk_key in enumerate(chunk_keys):
+            offset = i * self.cache_chunk_size
+            chunks[chunk_key] = data[offset:offset + self.cache_chunk_size]
+
+        # write the manifest last so no one finds it before it's chunks
+        if self.mc.set_multi(chunks,ttl,noreply=self.cache_noreply):
+            return False
+        print 'cached in %s chunks: %s' % (len(chunks), cache_key)
+        return self.mc.set(cache_key,manifest,ttl,noreply=self.cache_noreply)
+
+    def _join_chunked(self, cache_responses):
+        """
+        replaces the chunk manifests in the dict of cache responses w/
+        the data they point to, dropping any that can't be put back
+        together (a chunk was evicted or overwritten)
+        """
+        manifests = dict((k, v) for k, v in cache_responses.iteritems()
+                         if isinstance(v, dict))
+        if not manifests:
+            return cache_responses
+
+        # all the chunks in one trip
+        chunk_keys = []
+        for cache_key, manifest in manifests.iteritems():
+            chunk_keys.extend(self._get_chunk_keys(cache_key,manifest))
+        chunks = self.mc.get_multi(chunk_keys)
+
+        for cache_key, manifest in manifests.iteritems():
+            del cache_responses[cache_key]
+            keys = self._get_chunk_keys(cache_key,manifest)
+            if not all(k in chunks for k in keys):
+                continue
+            data = ''.join(chunks[k] for k in keys)
+            if (len(data) != manifest['length']
+                or sha1(data).hexdigest() != manifest['digest']):
+                continue
+            cache_responses[cache_key] = data
+
+        return cache_responses
+
+    def _get_chunk_keys(self, cache_key, manifest):
+        # keyed by content so a rewrite never mixes w/ old chunks
+        return ['%s:%s:%s' % (cache_key, manifest['digest'][:16], i)
+                for i in xrange(manifest['chunks'])]
+
+    def _set_l1(self, cache_key, response):
+        response = copy(response)
+        response.from_cache = None
+        size = len(response.content or '') + len(response.url or '')
+        # too big to keep around just leaves the old copy out
+        self.l1.set(cache_key, response, size)
+
+    def _from_cache(self, response):
+        """ returns a copy of the cached response to hand out """
+        response = copy(response)
+        response.from_cache = True
+        return response
+
+    def is_cacheable_request(self,request):
+        """ returns True if the request's method can be cached """
+        return (request.method or 'get').upper() in self.cacheable_methods
+
+    def invalidate(self,url):
+        """ drops the cached responses to the cacheable methods for url """
+        for method in self.cacheable_methods:
+            cache_key = self.get_cache_key(o.Request(url=url,method=method))
+            # a vary marker goes too, it's variants can't be found w/o it
+            self.l1.delete(cache_key)
+            self.mc.delete(cache_key,noreply=self.cache_noreply)
+
+    def get_cache_key(self,request,vary=None):
+        """
+        returns the key for the given request in the cache. the url
+        is canonicalized so however it's written it's the same key,
+        the method and data are part of it. vary is the headers the
+        cached response varies on, the key is for our request's
+        values of them
+        """
+        try:
+            url = canonical_url(request.url)
+        except (UnicodeError, ValueError):
+            url = request.url
+        parts = [(request.method or 'get').upper(), url]
+        if request.data:
+            parts.append(urllib.urlencode(sorted(request.data.items())))
+        if vary:
+            headers = self.get_request_headers(request)
+            for name in vary:
+                parts.append('%s: %s' % (name, headers.get(name, '')))
+        return 'httpcache:%s' % sha1('\n'.join(parts)).hexdigest()
+
+    def get_request_headers(self,request):
+        """
+        returns the headers which differ between the requests we
+        make, by lower cased name. the rest are the same for every
+        request, they can't tell variants apart
+        """
+        headers = {}
+        if request.cookies:
+            headers['cookie'] = '; '.join('%s=%s' % item
+                                  for item in sorted(request.cookies.items()))
+        return headers
 
     def _serialize_o(self, obj):
+        if fastbinary:
+            # straight to a string, no transport or protocol in between
+            return fastbinary.encode_binary(obj,
+                                            (obj.__class__, obj.thrift_spec))
         trans = TTransport.TMemoryBuffer()
         prot = self.pfactory.getProtocol(trans)
         obj.write(prot)
         return trans.getvalue()
 
     def _deserialize_o(self, objtype, data):
-        prot = self.pfactory.getProtocol(TTransport.TMemoryBuffer(data))
         ret = objtype()
-        ret.read(prot)
+        # the buffer reads the data in place, it isn't copied
+        trans = TTransport.TMemoryBuffer(data)
+        if fastbinary:
+            fastbinary.decode_binary(ret, trans,
+                                     (objtype, objtype.thrift_spec))
+            return ret
+        ret.read(self.pfactory.getProtocol(trans))
         return ret
 
 class RateLimitingRequestHandler(RequestHandler):
 
+    # 'redis' checks / updates the shared limiter every request,
+    # 'local' works from budget leased to this process (see
+    # lib.tokenbucket) so most requests don't touch redis
+    rate_limit_mode = 'redis'
+    rate_lease_size = 256 * 1024
+    rate_lease_requests = 10
+    rate_lease_fraction = 0.25
+    rate_sync_interval = 1
+
     def __init__(self, redis_host='127.0.0.1',
                        max_data_rate=(
                            1024 * 1024 * 3, # 3MB
+                           10), # per 10 seconds
+                       max_request_rate=(
+                           100, # requests
                            10)): # per 10 seconds
 
         self.redis_host = redis_host
@@ -163,13 +964,28 @@ class RateLimitingRequestHandler(RequestHandler):
 
         # based on bytes / s
         self.max_data_rate = max_data_rate
+        # and requests / s
+        self.max_request_rate = max_request_rate
 
-        # our limiter
-        self.rl = RateLimiter(
+        # our limiter, checks both rates at once
+        bucket_span = max(min(max_data_rate[1], max_request_rate[1]) / 10, 1)
+        self.rl = HostRateLimiter(
             self.rc, 'httplimiter',
-            max_data_rate[1] / 10,
-            max_data_rate[1])
-        )
+            max_data_rate,
+            max_request_rate,
+            bucket_span)
+
+        # process local budget, leased from the limiter
+        self.local_rl = None
+        if self.rate_limit_mode == 'local':
+            self.local_rl = LeasedRateLimiter(
+                self.rl, self.rate_lease_size, self.rate_lease_requests,
+                bucket_span, self.rate_sync_interval,
+                self.rate_lease_fraction)
+
+        # wakes up requests waiting on the limiter
+        self.scheduler = RateScheduler(self.check_root_allowed,
+                                       bucket_span)
 
     def check_rate_allowed(self, request):
         """
@@ -177,19 +993,41 @@ class RateLimitingRequestHandler(RequestHandler):
         for the given site. We are limiting our rate to
         a given MB/s
         """
+        return self.check_root_allowed(self._get_url_root(request))
 
-        size, seconds = self.max_data_rate
-        root = self._get_url_root(request)
-        count = self.rl.count(root,seconds)
+    def check_root_allowed(self, root):
+        """
+        returns the # of bytes we can still pull from the root,
+        0 if we are out of requests
+        """
+        if self.local_rl:
+            return self.local_rl.allowed(root)
+
+        size, requests = self.rl.remaining(root)
         # we are going to return the max # of bytes
-        return size - count
+        return size if requests > 0 else 0
 
     def update_rate(self, response):
         """
-        updates the rate tracking info based on the response
+        updates the rate tracking info based on the response,
+        which should have come from the host not the cache
         """
-        root = self._get_url_root(response)
-        self.rl.add(root,len(response.content)) # bytes
+        self.update_root_rate(self._get_url_root(response),
+                              len(response.content or ''))
+
+    def update_root_rate(self, root, size):
+        """ counts a request of size bytes against the root """
+        if self.local_rl:
+            self.local_rl.consume(root,size)
+        else:
+            self.rl.add(root,size) # bytes
+        self.scheduler.record(root,size)
+
+    def shutdown(self):
+        # usage we haven't pushed to redis yet would be lost, and
+        # the budget we hold would stay spent
+        if self.local_rl:
+            self.local_rl.sync(release=True)
 
     def _get_url_root(self, response):
         # get url w/ path
@@ -204,65 +1042,350 @@ class MatureRequestHandler(CachingRequestHandler,
                            LiveRequestHandler,
                            RateLimitingRequestHandler):
 
+    # share live fetches w/ other server processes, not just threads
+    coalesce_across_processes = False
+    # how long another process' fetch can hold the lock / how
+    # often we check if it's done
+    fetch_lock_ttl = 60
+    fetch_lock_poll = 0.1
+
     def __init__(self, redis_host=None,
                        memcache_host=None,
                        memcache_port=None,
-                       max_data_rate=None):
+                       max_data_rate=None,
+                       max_request_rate=None):
 
         # initialize the lil ppl
+        LiveRequestHandler.__init__(self)
+
+        # live fetches in flight, by cache key
+        self.flights = SingleFlight()
+
         args = [x for x in [memcache_host,memcache_port] if x]
         CachingRequestHandler.__init__(self,*args)
 
         args = [x for x in [redis_host,max_data_rate] if x]
-        RateLimitingRequestHandler.__init__(self,*args)
+        kwargs = {}
+        if max_request_rate:
+            kwargs['max_request_rate'] = max_request_rate
+        RateLimitingRequestHandler.__init__(self,*args,**kwargs)
 
 
     def urlopen(self, request):
         print 'urlopen: %s' % request.url
 
-        response = None
+        response = stale = None
 
         if not request.no_cache:
-            # check the cache
-            response = self.cache_urlopen(request)
-            if response:
+            # check the cache, a stale body isn't worth reading
+            # until we know the host hasn't changed it, unless
+            # we'll hand it out in the mean time
+            response = self._cache_get(request, lambda r:
+                                       httpcache.is_fresh(r)
+                                       or self._serves_while_stale(r))
+            if response and not httpcache.is_fresh(response):
+                print 'stale response from cache: %s' % request.url
+                stale, response = response, None
+            elif response:
                 print 'response from cache: %s' % request.url
 
+        if stale and self._serves_while_stale(stale):
+            # no waiting on the host, we refresh it in the background
+            # w/in it's rate limit
+            print 'revalidating in background: %s' % request.url
+            self._submit_fetch(request, stale)
+            return stale
+
+        # make our request, on the fetch engine so the host's
+        # limit on in flight fetches is respected
+        if not response:
+            response = self._result_or_stale(
+                request, self._submit_fetch(request, stale), stale)
+
+        # return the response
+        print 'returning urlopen: %s' % request.url
+        return response
+
+    def urlopen_multi(self, batch):
+        print 'urlopen_multi: %s requests' % len(batch)
+
+        results = [None] * len(batch)
+        stale = {}
+
+        # check the cache for the whole batch at once
+        lookups = [i for i, r in enumerate(batch) if not r.no_cache]
+        if lookups:
+            cached = self.cache_urlopen_multi([batch[i] for i in lookups])
+            for i, response in zip(lookups, cached):
+                if not response:
+                    continue
+                if (not httpcache.is_fresh(response)
+                    and not self._serves_while_stale(response)):
+                    stale[i] = response
+                    continue
+                if not httpcache.is_fresh(response):
+                    print 'revalidating in background: %s' % response.url
+                    self._submit_fetch(batch[i], response)
+                results[i] = o.BatchResponse(response=response)
+
+        # fetch whatever is left live, all at once
+        futures = {}
+        for i, result in enumerate(results):
+            if result is None:
+                futures[i] = self._submit_fetch(batch[i], stale.get(i))
+        print 'urlopen_multi: %s cache misses' % len(futures)
+
+        for i, future in futures.iteritems():
+            try:
+                response = self._result_or_stale(batch[i], future,
+                                                 stale.get(i))
+                results[i] = o.BatchResponse(response=response)
+            except o.Exception, ex:
+                results[i] = o.BatchResponse(ex=ex)
+            except Exception, ex:
+                results[i] = o.BatchResponse(
+                    ex=o.Exception('Batch Request Error: %s' % ex))
+
+        print 'returning urlopen_multi: %s requests' % len(batch)
+        return results
+
+    def urlopen_stream(self, request):
+        print 'urlopen_stream: %s' % request.url
+
+        # streams always come from the host, it's bytes count once
+        # the stream is done
+        self.wait_for_allowed(request)
+        return LiveRequestHandler.urlopen_stream(self, request)
+
+    def stream_closed(self, request, size):
+        print 'stream closed: %s %s' % (request.url, size)
+        self.update_root_rate(self._get_url_root(request), size)
+
+    def _serves_while_stale(self, response):
+        """ returns True if the stale response can go out while refreshing """
+        return httpcache.may_serve_stale(response, 'stale-while-revalidate',
+                                         self.stale_while_revalidate)
+
+    def _serves_on_error(self, response):
+        """ returns True if the stale response can stand in for an error """
+        return httpcache.may_serve_stale(response, 'stale-if-error',
+                                         self.stale_if_error)
+
+    def _result_or_stale(self, request, future, stale=None):
+        """
+        returns the live fetch's response, or the stale copy if the
+        host failed us and the copy is w/in it's stale-if-error window
+        """
+        try:
+            response = future.result()
+        except Exception, ex:
+            fallback = self._stale_for_error(request, stale)
+            if fallback is None:
+                raise
+            print 'host failed, serving stale: %s: %s' % (request.url, ex)
+            return fallback
+
+        if response.status_code >= 500:
+            fallback = self._stale_for_error(request, stale)
+            if fallback is not None:
+                print 'host error %s, serving stale: %s' % (
+                    response.status_code, request.url)
+                return fallback
+        return response
+
+    def _stale_for_error(self, request, stale):
+        """ returns the stale copy w/ it's body if it can replace an error """
+        if not stale or not self._serves_on_error(stale):
+            return None
+        if stale.content is None:
+            # we didn't read it's body, figuring we'd revalidate it
+            return self.cache_urlopen(request)
+        return stale
+
+    def _submit_fetch(self, request, stale=None):
+        """
+        starts the live fetch for the request, unless one is already
+        in flight in which case we share it. returns a future for
+        the response.
+        """
+        if not self.is_cacheable_request(request):
+            # each one has it's own effect on the host, no sharing
+            return self.submit_live(request, self._fetch_live, request,
+                                    stale)
+
+        # requests w/ different cookies can get different responses
+        flight_key = self.get_cache_key(request, ['cookie'])
+        future, leader = self.flights.join(flight_key)
+        if leader:
+            self.submit_live(request, self.flights.run, flight_key, future,
+                             self._fetch_coalesced, request, stale)
+        else:
+            print 'joining fetch in flight: %s' % request.url
+        return future
+
+    def _fetch_coalesced(self, request, stale=None):
+        """
+        does the live fetch, unless another process is already doing
+        it in which case we wait for it's response to hit the cache
+        """
+        if (not self.coalesce_across_processes or request.no_cache
+            or not self.is_cacheable_request(request)):
+            return self._fetch_live(request, stale)
+
+        lock_key = '%s:lock' % self.get_cache_key(request)
+        # the lock holds our token so we only ever release our own
+        token = uuid4().hex
+        locked = self.mc.add(lock_key, token, self.fetch_lock_ttl)
+        if not locked:
+            print 'waiting on another process: %s' % request.url
+            response = self._wait_for_fetch(request, lock_key)
+            if response:
+                return response
+            # they didn't come through, we'll do it. someone else
+            # may have beat us to the lock, we fetch anyway
+            locked = self.mc.add(lock_key, token, self.fetch_lock_ttl)
+
+        expires = time() + self.fetch_lock_ttl
+        try:
+            return self._fetch_live(request, stale)
+        finally:
+            if locked:
+                self._release_fetch_lock(lock_key, token, expires)
+
+    def _release_fetch_lock(self, lock_key, token, expires):
+        """ deletes the fetch lock if it's still the one we took """
+        # past the ttl it's expired, whatever is there isn't ours
+        if time() < expires and self.mc.get(lock_key) == token:
+            self.mc.delete(lock_key)
+
+    def _wait_for_fetch(self, request, lock_key):
+        """
+        waits for the fetch holding the lock to cache a fresh response,
+        returns None if it releases the lock w/o one or takes too long
+        """
+        cache_key = self.get_cache_key(request)
+        give_up = time() + self.fetch_lock_ttl
+        while time() < give_up:
+            sleep(self.fetch_lock_poll)
+            locked = self.mc.get(lock_key)
+            # our in process copy would hide theirs
+            self.l1.delete(cache_key)
+            response = self.cache_urlopen(request)
+            if response and httpcache.is_fresh(response):
+                return response
+            if not locked:
+                return None
+        return None
+
+    def _fetch_live(self, request, stale=None):
+        """
+        pulls the request from the host and caches it. if we have
+        a stale copy we only ask for the resource if it's changed
+        """
+        headers = stale and httpcache.conditional_headers(stale)
+        response = self._pull_live(request, headers)
+
+        if (stale and response.status_code >= 500
+            and self._serves_on_error(stale)):
+            # the copy we have is better than the error, keep it
+            print 'host error %s: %s' % (response.status_code, request.url)
+            return response
+
+        if stale and response.status_code == 304:
+            # our copy is still good, it's fresh again
+            print 'not modified: %s' % request.url
+            refreshed = self.refresh_cache(
+                request, httpcache.refresh(stale, response))
+            if refreshed:
+                return refreshed
+            # the body we had was evicted in the mean time
+            print 'lost cached body: %s' % request.url
+            response = self._pull_live(request)
+
+        # update the cache
+        self.set_cache(request,response)
+        return response
+
+    def _pull_live(self, request, headers=None):
+
         # check and make sure we aren't going to have
         # to fail due to rate limiting for the site
         # this should return the rate at which we can
         # pull data.
-        if not response:
-            self.wait_for_allowed(request)
+        self.wait_for_allowed(request)
 
-        # make our request
-        if not response:
-            response = self.live_urlopen(request)
-            print 'live response: %s' % request.url
-            # update the cache
-            self.set_cache(request,response)
+        response = self.live_urlopen(request, headers)
+        print 'live response: %s' % request.url
 
-        # update the rate limiter
+        # only what we actually pulled from the host counts
+        # against it, cache hits don't
         self.update_rate(response)
-
-        # return the response
-        print 'returning urlopen: %s' % request.url
         return response
 
     def wait_for_allowed(self, request):
-        allowed_rate = self.check_rate_allowed(request)
-        print 'allow rate: %s' % allowed_rate
-        while allowed_rate < 1:
-            sleep(1)
-            allowed_rate = self.check_rate_allowed(request)
+        root = self._get_url_root(request)
+
+        # get in line behind anyone already waiting on the host
+        if not self.scheduler.waiting(root):
+            allowed_rate = self.check_root_allowed(root)
             print 'allow rate: %s' % allowed_rate
+            if allowed_rate >= 1:
+                print 'allowed!'
+                return True
+
+        # the scheduler wakes us when there's budget again
+        self.scheduler.wait(root)
         print 'allowed!'
         return True
 
 
 def run():
-    from run_services import serve_service
-    serve_service(Requester, MatureRequestHandler())
+    from optparse import OptionParser
+    from lib.server import MODELS
+
+    parser = OptionParser()
+    parser.add_option('--host', default='0.0.0.0')
+    parser.add_option('--port', type='int', default=9090)
+    parser.add_option('--server', dest='model', choices=MODELS,
+                      help='serve w/ the built in server: %s'
+                           % ', '.join(MODELS))
+    parser.add_option('--workers', type='int', default=10,
+                      help='threads handling calls')
+    parser.add_option('--queue-size', type='int', default=0,
+                      help='connections / calls waiting on a worker '
+                           'before we stop accepting, 0 for no limit')
+    parser.add_option('--processes', type='int', default=0,
+                      help='pre-fork this many processes sharing the '
+                           'listening socket, needs --server')
+    parser.add_option('--max-requests', type='int', default=0,
+                      help='replace a process after it handles this '
+                           'many calls, 0 to keep it forever')
+    parser.add_option('--graceful-timeout', type='int', default=30,
+                      help="seconds a process has to finish it's calls "
+                           "when it's replaced or stopped")
+    options, args = parser.parse_args()
+
+    if options.processes:
+        if not options.model:
+            parser.error('--processes needs --server')
+        # each process builds it's own handler after the fork
+        from lib.server import serve_prefork
+        serve_prefork(Requester, MatureRequestHandler, options.host,
+                      options.port, options.model, options.workers,
+                      options.queue_size, options.processes,
+                      options.max_requests, options.graceful_timeout)
+        return
+
+    handler = MatureRequestHandler()
+
+    if not options.model:
+        from run_services import serve_service
+        serve_service(Requester, handler)
+        return
+
+    from lib.server import serve
+    serve(Requester, handler, options.host, options.port,
+          options.model, options.workers, options.queue_size)
 
 if __name__ == '__main__':
     run()
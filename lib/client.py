@@ -0,0 +1,89 @@
+"""
+requester client for greenlets
+
+calls share a pool of connections to the requester, a call only
+holds a connection while it waits on it's reply so thousands of
+greenlets can share a few connections. the *_async calls return a
+greenlet, it's get() returns the call's result or raises what it
+raised. the process should be monkey patched by gevent so waiting
+on a reply only blocks the calling greenlet.
+
+    client = AsyncRequester('127.0.0.1', 9090)
+    greenlets = [client.urlopen_async(r) for r in requests]
+    gevent.joinall(greenlets)
+"""
+
+import gevent
+from gevent.queue import LifoQueue
+
+from thrift.transport import TSocket, TTransport
+from thrift.protocol import TBinaryProtocol
+
+from tgen.requester import Requester, ttypes as o
+
+
+class AsyncRequester(object):
+
+    def __init__(self, host='127.0.0.1', port=9090, max_connections=10,
+                       timeout=None):
+        self.host = host
+        self.port = port
+        # seconds we'll wait on a reply, None to wait forever
+        self.timeout = timeout
+
+        # open clients, most recently used first. None is a slot
+        # for a connection we haven't opened yet
+        self.pool = LifoQueue(max_connections)
+        for i in xrange(max_connections):
+            self.pool.put(None)
+
+    def urlopen(self, request):
+        return self.call('urlopen', request)
+
+    def urlopen_multi(self, requests):
+        return self.call('urlopen_multi', requests)
+
+    def urlopen_async(self, request):
+        return self.spawn('urlopen', request)
+
+    def call(self, name, *args):
+        """ makes the call, waiting for a free connection if need be """
+        client = self.pool.get()
+        try:
+            if client is None:
+                client = self._connect()
+            return getattr(client, name)(*args)
+        except o.Exception:
+            # the call failed, the connection is fine
+            raise
+        except Exception:
+            # we don't know what state it's in, don't reuse it
+            self._close(client)
+            client = None
+            raise
+        finally:
+            self.pool.put(client)
+
+    def spawn(self, name, *args):
+        """ makes the call in a new greenlet, returns the greenlet """
+        return gevent.spawn(self.call, name, *args)
+
+    def close(self):
+        """ closes the idle connections """
+        idle = [self.pool.get() for i in xrange(self.pool.qsize())]
+        for client in idle:
+            self._close(client)
+            self.pool.put(None)
+
+    def _connect(self):
+        sock = TSocket.TSocket(self.host, self.port)
+        if self.timeout:
+            sock.setTimeout(self.timeout * 1000)
+        transport = TTransport.TBufferedTransport(sock)
+        protocol = TBinaryProtocol.TBinaryProtocolAccelerated(transport)
+        transport.open()
+        return Requester.Client(protocol)
+
+    def _close(self, client):
+        if client is not None:
+            client._iprot.trans.close()
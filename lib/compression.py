@@ -0,0 +1,79 @@
+"""
+codecs for compressing cached response bodies
+
+each codec has a fixed id which gets stored along w/ the compressed
+data so we know how to get it back out, don't renumber them. zlib is
+always around, lz4 and snappy are used if their modules are installed.
+"""
+
+import zlib
+
+try:
+    import lz4.block as _lz4
+except ImportError:
+    try:
+        import lz4 as _lz4
+    except ImportError:
+        _lz4 = None
+
+try:
+    import snappy as _snappy
+except ImportError:
+    _snappy = None
+
+NONE = 0
+ZLIB = 1
+LZ4 = 2
+SNAPPY = 3
+
+# name -> id
+CODECS = {'none': NONE, 'zlib': ZLIB, 'lz4': LZ4, 'snappy': SNAPPY}
+
+
+class CodecError(Exception):
+    pass
+
+
+def available():
+    """ returns the names of the codecs we can use """
+    names = ['none', 'zlib']
+    if _lz4:
+        names.append('lz4')
+    if _snappy:
+        names.append('snappy')
+    return names
+
+
+def compress(data, codec='zlib', level=6):
+    """
+    returns (codec id, compressed data). level only applies to zlib
+    """
+    if codec == 'none':
+        return NONE, data
+    if codec == 'zlib':
+        return ZLIB, zlib.compress(data, level)
+    if codec == 'lz4' and _lz4:
+        return LZ4, _lz4.compress(data)
+    if codec == 'snappy' and _snappy:
+        return SNAPPY, _snappy.compress(data)
+    raise CodecError('Codec not available: %s' % codec)
+
+
+def decompress(codec_id, data):
+    """
+    returns the data compressed w/ the given codec id, CodecError if
+    we don't have the codec or the data is damaged
+    """
+    if codec_id == NONE:
+        return data
+    try:
+        if codec_id == ZLIB:
+            return zlib.decompress(data)
+        if codec_id == LZ4 and _lz4:
+            return _lz4.decompress(data)
+        if codec_id == SNAPPY and _snappy:
+            return _snappy.uncompress(data)
+    except Exception, ex:
+        # each codec has it's own errors
+        raise CodecError('Bad data for codec %s: %s' % (codec_id, ex))
+    raise CodecError('Can not decompress codec: %s' % codec_id)
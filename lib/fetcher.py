@@ -0,0 +1,128 @@
+"""
+bounded pool of worker threads for pulling resources from hosts
+
+jobs are submitted along w/ the host they are going to hit. no more
+than max_per_host jobs for one host run at once, the rest wait their
+turn in a per host line so they don't tie up workers other hosts
+could be using.
+"""
+
+import sys
+import threading
+from Queue import Queue
+from collections import deque
+
+
+class FetchTimeout(Exception):
+    pass
+
+
+class FetchFuture(object):
+    """ the eventual result of a job submitted to the engine """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        blocks until the job finishes, returning it's result or
+        raising whatever it raised
+        """
+        if not self._done.wait(timeout):
+            raise FetchTimeout('fetch did not finish in %ss' % timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class FetchEngine(object):
+
+    def __init__(self, workers=200, max_per_host=4):
+        self.workers = workers
+        self.max_per_host = max_per_host
+
+        self.lock = threading.Lock()
+        # jobs which are allowed to run
+        self.jobs = Queue()
+        # host -> # of jobs running or queued to run
+        self.active = {}
+        # host -> jobs waiting on the host's limit
+        self.waiting = {}
+
+        self.threads = []
+        for i in xrange(self.workers):
+            t = threading.Thread(target=self._work,
+                                 name='fetcher-%s' % i)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, host, fn, *args, **kwargs):
+        """
+        queues fn to be run against the given host, returns
+        a FetchFuture for it's result
+        """
+        future = FetchFuture()
+        job = (host, future, fn, args, kwargs)
+
+        with self.lock:
+            if self.active.get(host, 0) < self.max_per_host:
+                self.active[host] = self.active.get(host, 0) + 1
+                self.jobs.put(job)
+            else:
+                self.waiting.setdefault(host, deque()).append(job)
+
+        return future
+
+    def in_flight(self):
+        """ returns the # of jobs running or ready to run """
+        with self.lock:
+            return sum(self.active.itervalues())
+
+    def shutdown(self):
+        """ stops the workers once the queued jobs are done """
+        for t in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            host, future, fn, args, kwargs = job
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+            self._job_done(host)
+
+    def _job_done(self, host):
+        # hand the host's slot to the next in line, or give it up
+        with self.lock:
+            waiting = self.waiting.get(host)
+            if waiting:
+                self.jobs.put(waiting.popleft())
+                if not waiting:
+                    del self.waiting[host]
+            else:
+                self.active[host] -= 1
+                if not self.active[host]:
+                    del self.active[host]
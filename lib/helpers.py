@@ -1,6 +1,42 @@
+import re
 import urlparse, urllib
 
+from lib.lrucache import LRUCache
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+# urls made only of chars which fixurl leaves alone come back as is
+SAFE_URL = re.compile(r'[a-z][a-z0-9+.-]*://[A-Za-z0-9.-]+(:[0-9]+)?'
+                      r'(/[A-Za-z0-9_./-]*)?(\?[A-Za-z0-9_./?=&-]+)?\Z')
+
+# fixed urls and idna encoded hosts we've already worked out
+fixed_urls = LRUCache(50000, 32 * 1024 * 1024)
+encoded_hosts = LRUCache(10000, 1024 * 1024)
+
 def fixurl(url):
+    # nothing to fix
+    if SAFE_URL.match(url):
+        return str(url)
+
+    fixed = fixed_urls.get(url)
+    if fixed is None:
+        fixed = _fixurl(url)
+        fixed_urls.set(url,fixed,len(url) + len(fixed))
+    return fixed
+
+def encode_host(host):
+    """ returns the unicode host idna encoded """
+    encoded = encoded_hosts.get(host)
+    if encoded is None:
+        try:
+            encoded = host.encode('idna')
+        except UnicodeError:
+            # not a name idna can do anything w/ (empty / long labels)
+            encoded = urllib.quote(host.encode('utf8'))
+        encoded_hosts.set(host,encoded,len(host) + len(encoded))
+    return encoded
+
+def _fixurl(url):
     # turn string into unicode
     if not isinstance(url,unicode):
         url = url.decode('utf8')
@@ -9,7 +45,7 @@ def fixurl(url):
     parsed = urlparse.urlsplit(url)
 
     # divide the netloc further
-    userpass,at,hostport = parsed.netloc.partition('@')
+    userpass,at,hostport = parsed.netloc.rpartition('@')
     user,colon1,pass_ = userpass.partition(':')
     host,colon2,port = hostport.partition(':')
 
@@ -19,7 +55,7 @@ def fixurl(url):
     colon1 = colon1.encode('utf8')
     pass_ = urllib.quote(pass_.encode('utf8'))
     at = at.encode('utf8')
-    host = host.encode('idna')
+    host = encode_host(host)
     colon2 = colon2.encode('utf8')
     port = port.encode('utf8')
     path = '/'.join(  # could be encoded slashes!
@@ -33,3 +69,21 @@ def fixurl(url):
     netloc = ''.join((user,colon1,pass_,at,host,colon2,port))
     return urlparse.urlunsplit((scheme,netloc,path,query,fragment))
 
+
+def canonical_url(url):
+    """
+    returns the url fixed up by fixurl in a form which is the same
+    however it was written: scheme and host lower cased, the default
+    port and fragment dropped, the query's params sorted
+    """
+    scheme,netloc,path,query,fragment = urlparse.urlsplit(fixurl(url))
+    scheme = scheme.lower()
+
+    userpass,at,hostport = netloc.rpartition('@')
+    host,colon,port = hostport.partition(':')
+    if port == DEFAULT_PORTS.get(scheme):
+        colon = port = ''
+    netloc = ''.join((userpass,at,host.lower(),colon,port))
+
+    query = '&'.join(sorted(p for p in query.split('&') if p))
+    return urlparse.urlunsplit((scheme,netloc,path or '/',query,''))
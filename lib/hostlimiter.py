@@ -0,0 +1,77 @@
+"""
+per host byte and request rate limits, shared through redis
+
+usage is counted in time buckets, each bucket is a redis hash w/ the
+bytes and requests seen in it. checking both limits reads all the
+buckets in the window in one pipelined round trip, and recording usage
+updates both counters in another.
+"""
+
+from time import time
+
+
+class HostRateLimiter(object):
+
+    def __init__(self, rc, prefix, max_data_rate, max_request_rate,
+                       bucket_span=1):
+        self.rc = rc
+        self.prefix = prefix
+        # (bytes, seconds) and (requests, seconds)
+        self.max_data_rate = max_data_rate
+        self.max_request_rate = max_request_rate
+        self.bucket_span = bucket_span
+
+        # the longer window covers both
+        self.window = max(max_data_rate[1], max_request_rate[1])
+
+    def remaining(self, host):
+        """
+        returns (bytes, requests) we can still pull from the host
+        before going over either limit
+        """
+        now = int(time() / self.bucket_span)
+        buckets = range(now - self._buckets(self.window) + 1, now + 1)
+
+        pipe = self.rc.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hmget(self._key(host, bucket), 'bytes', 'requests')
+        counts = pipe.execute()
+
+        size, seconds = self.max_data_rate
+        data_start = now - self._buckets(seconds) + 1
+        requests, seconds = self.max_request_rate
+        request_start = now - self._buckets(seconds) + 1
+
+        for bucket, (nbytes, nrequests) in zip(buckets, counts):
+            if bucket >= data_start:
+                size -= int(nbytes or 0)
+            if bucket >= request_start:
+                requests -= int(nrequests or 0)
+
+        return size, requests
+
+    def add(self, host, size, requests=1, bucket=None):
+        """
+        records pulling size bytes in the given # of requests, in the
+        current bucket or the given one. returns the bucket
+        """
+        now = int(time() / self.bucket_span)
+        if bucket is None:
+            bucket = now
+        elif bucket <= now - self._buckets(self.window):
+            # it's left the window, nothing counts it anymore
+            return bucket
+
+        key = self._key(host, bucket)
+        pipe = self.rc.pipeline(transaction=False)
+        pipe.hincrby(key, 'bytes', size)
+        pipe.hincrby(key, 'requests', requests)
+        pipe.expire(key, self.window + self.bucket_span)
+        pipe.execute()
+        return bucket
+
+    def _buckets(self, seconds):
+        return max(1, int(seconds / self.bucket_span))
+
+    def _key(self, host, bucket):
+        return '%s:%s:%s' % (self.prefix, host, bucket)
@@ -0,0 +1,224 @@
+"""
+http caching rules (rfc 2616, section 13) for deciding how long a
+response stays fresh and how to revalidate it once it's gone stale
+"""
+
+from time import time
+from email.utils import parsedate_tz, mktime_tz
+
+# seconds a response is fresh for when it tells us nothing
+DEFAULT_LIFETIME = 60 * 5
+
+# the Last-Modified heuristic gives a response 10% of it's age,
+# up to this many seconds
+MAX_HEURISTIC_LIFETIME = 60 * 60 * 24
+
+# statuses which get the default / heuristic lifetime when they don't
+# say how long they're fresh for (rfc 7231, section 6.1), anything
+# else has to say
+HEURISTIC_STATUSES = frozenset([200, 203, 204, 300, 301, 404, 405, 410,
+                                414])
+
+
+def get_header(headers, name, default=None):
+    """ case insensitive header lookup """
+    if not headers:
+        return default
+    name = name.lower()
+    for key, value in headers.iteritems():
+        if key.lower() == name:
+            return value
+    return default
+
+
+def parse_cache_control(headers):
+    """
+    returns the Cache-Control directives as a dict, directives
+    w/o a value map to True
+    """
+    directives = {}
+    for part in (get_header(headers, 'cache-control') or '').split(','):
+        name, eq, value = part.strip().partition('=')
+        if not name:
+            continue
+        directives[name.lower()] = value.strip('"') if eq else True
+    return directives
+
+
+def parse_http_date(value):
+    """ returns the http date as a unix timestamp, None if it's bad """
+    if not value:
+        return None
+    parsed = parsedate_tz(value)
+    if not parsed:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def _seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def storable_status(status_code):
+    """
+    returns False for statuses we never store: errors on the host's
+    end, and 304s which have no body of their own
+    """
+    return status_code != 304 and status_code < 500
+
+
+def is_cacheable(response):
+    """ returns False if the response may not be stored """
+    if not storable_status(response.status_code):
+        return False
+    cc = parse_cache_control(response.headers)
+    # we're a shared cache, private responses are for one user
+    if 'no-store' in cc or 'private' in cc:
+        return False
+    # varies on something other than the request, never reusable
+    return vary_headers(response) != ['*']
+
+
+def vary_headers(response):
+    """
+    returns the sorted, lower cased names of the request headers
+    the response varies on
+    """
+    vary = get_header(response.headers, 'vary') or ''
+    return sorted(set(name.strip().lower() for name in vary.split(',')
+                      if name.strip()))
+
+
+def freshness_lifetime(response, default=DEFAULT_LIFETIME):
+    """ returns how many seconds the response is fresh for """
+    headers = response.headers
+    cc = parse_cache_control(headers)
+
+    if 'no-cache' in cc:
+        return 0
+
+    for directive in ('s-maxage', 'max-age'):
+        if directive in cc:
+            seconds = _seconds(cc[directive])
+            if seconds is not None:
+                return seconds
+
+    date = (parse_http_date(get_header(headers, 'date'))
+            or response.timestamp or time())
+
+    expires = get_header(headers, 'expires')
+    if expires is not None:
+        # bad Expires values mean already expired
+        expires = parse_http_date(expires)
+        return max(0, int(expires - date)) if expires else 0
+
+    # w/o a lifetime from the host only some statuses get one
+    if response.status_code not in HEURISTIC_STATUSES:
+        return 0
+
+    last_modified = parse_http_date(get_header(headers, 'last-modified'))
+    if last_modified and last_modified < date:
+        return min(int((date - last_modified) / 10),
+                   MAX_HEURISTIC_LIFETIME)
+
+    return default
+
+
+def current_age(response, now=None):
+    """ returns how many seconds old the response is """
+    now = now or time()
+    age = _seconds(get_header(response.headers, 'age')) or 0
+    return max(0, now - (response.timestamp or now)) + age
+
+
+def is_fresh(response, now=None):
+    """ returns True if the response can be served w/o revalidating """
+    return current_age(response, now) < freshness_lifetime(response)
+
+
+def staleness(response, now=None):
+    """ returns how many seconds past fresh the response is """
+    return current_age(response, now) - freshness_lifetime(response)
+
+
+STALE_DIRECTIVES = ('stale-while-revalidate', 'stale-if-error')
+
+
+def stale_window(response, directive, default=0):
+    """
+    returns how many seconds past fresh the response can still be
+    served under the rfc 5861 directive (stale-while-revalidate or
+    stale-if-error). default only applies to responses which were
+    fresh for a while and say nothing about serving stale
+    """
+    cc = parse_cache_control(response.headers)
+    # it has to be revalidated once it's stale (s-maxage implies
+    # proxy-revalidate for a shared cache like us)
+    for never in ('must-revalidate', 'proxy-revalidate', 's-maxage',
+                  'no-cache', 'no-store'):
+        if never in cc:
+            return 0
+    value = cc.get(directive)
+    seconds = _seconds(value) if value is not True else None
+    if seconds is not None:
+        return seconds
+    # the origin set it's own windows, the one it left out is 0
+    if any(d in cc for d in STALE_DIRECTIVES):
+        return 0
+    if freshness_lifetime(response) <= 0:
+        return 0
+    return default
+
+
+def may_serve_stale(response, directive, default=0, now=None):
+    """ returns True if the response is w/in the directive's window """
+    return staleness(response, now) <= stale_window(response, directive,
+                                                    default)
+
+
+def has_validators(response):
+    """ returns True if we could make a conditional request for it """
+    return bool(get_header(response.headers, 'etag')
+                or get_header(response.headers, 'last-modified'))
+
+
+def conditional_headers(response):
+    """
+    returns the request headers asking the host to only send the
+    resource if it's changed since the given response
+    """
+    headers = {}
+    etag = get_header(response.headers, 'etag')
+    if etag:
+        headers['If-None-Match'] = etag
+    last_modified = get_header(response.headers, 'last-modified')
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def refresh(cached, not_modified):
+    """
+    updates the stale cached response w/ the headers from a 304
+    and returns it, it's fresh again as of the 304
+    """
+    headers = dict(cached.headers or {})
+    lowered = dict((k.lower(), k) for k in headers)
+    for key, value in (not_modified.headers or {}).iteritems():
+        # the 304 doesn't describe the body, keep ours
+        if key.lower() in ('content-length', 'content-encoding',
+                           'transfer-encoding'):
+            continue
+        headers.pop(lowered.get(key.lower()), None)
+        headers[key] = value
+
+    cached.headers = headers
+    cached.timestamp = not_modified.timestamp
+    cached.response_time = not_modified.response_time
+    return cached
@@ -0,0 +1,90 @@
+"""
+in process least recently used cache, bounded by both the # of
+entries and the total size of the values
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024,
+                       sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # how we figure out the size of a value
+        self.sizeof = sizeof
+
+        self.lock = threading.Lock()
+        # key -> (value, size), oldest first
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """ returns the value for the key, marking it recently used """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        """ adds / replaces the key's value, evicting as needed """
+        if size is None:
+            size = self.sizeof(value)
+
+        with self.lock:
+            self._remove(key)
+
+            # never going to fit
+            if size > self.max_bytes:
+                return False
+
+            self.entries[key] = (value, size)
+            self.bytes += size
+
+            while (len(self.entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                old_value, old_size = self.entries.popitem(last=False)[1]
+                self.bytes -= old_size
+                self.evictions += 1
+
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            return self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.bytes}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[1]
+        return True
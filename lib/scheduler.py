@@ -0,0 +1,84 @@
+"""
+wakes up requests waiting on a host's rate limit
+
+instead of every waiting request polling the limiter, waiters for
+a host get in line behind one timer. the timer fires when the
+limiter's next bucket rolls over (which is when budget frees up),
+checks the host's budget once and lets waiters go in the order
+they showed up for as much budget as there looks to be.
+"""
+
+import threading
+from time import time
+from collections import deque
+
+
+class RateScheduler(object):
+
+    # budget we assume a request will use until we've seen the host
+    default_estimate = 64 * 1024
+
+    def __init__(self, check, bucket_span=1):
+        # host -> bytes we are allowed to pull from it right now
+        self.check = check
+        # seconds between the limiter's buckets rolling over
+        self.bucket_span = bucket_span
+
+        self.lock = threading.Lock()
+        # host -> events of the requests waiting on it, oldest first
+        self.waiters = {}
+        # host -> timer which will next check it
+        self.timers = {}
+        # host -> running average of bytes per request
+        self.estimates = {}
+
+    def waiting(self, host):
+        """ returns how many requests are waiting on the host """
+        with self.lock:
+            return len(self.waiters.get(host, ()))
+
+    def wait(self, host):
+        """ blocks until it's our turn to hit the host """
+        event = threading.Event()
+        with self.lock:
+            self.waiters.setdefault(host, deque()).append(event)
+            if host not in self.timers:
+                self._schedule(host)
+        event.wait()
+        return True
+
+    def record(self, host, size):
+        """ tracks how big the host's responses are """
+        with self.lock:
+            estimate = self.estimates.get(host, size)
+            self.estimates[host] = (estimate * 7 + size) / 8
+
+    def _schedule(self, host):
+        # wake up just after the next bucket rolls over
+        delay = self.bucket_span - (time() % self.bucket_span) + 0.01
+        timer = threading.Timer(delay, self._wake, (host,))
+        timer.daemon = True
+        self.timers[host] = timer
+        timer.start()
+
+    def _wake(self, host):
+        try:
+            allowed = self.check(host)
+        except Exception, ex:
+            # try again next bucket
+            print 'rate check failed: %s: %s' % (host, ex)
+            allowed = 0
+
+        with self.lock:
+            waiters = self.waiters.get(host)
+            estimate = max(1, self.estimates.get(host,
+                                                 self.default_estimate))
+            while waiters and allowed > 0:
+                waiters.popleft().set()
+                allowed -= estimate
+
+            if waiters:
+                self._schedule(host)
+            else:
+                self.waiters.pop(host, None)
+                self.timers.pop(host, None)
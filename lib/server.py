@@ -0,0 +1,507 @@
+"""
+thrift servers for running our services
+
+threaded:    a thread per client connection
+threadpool:  a fixed # of worker threads pulling connections off a queue
+nonblocking: a select loop doing the io w/ a fixed # of worker threads
+             running the calls, clients must use the framed transport
+gevent:      a greenlet per client connection, up to workers at once.
+             the process must be monkey patched by gevent before
+             anything else is imported (see handlers.async_requester)
+
+any model but nonblocking can also run pre-forked (see serve_prefork):
+worker processes each w/ their own handler, sharing one listening
+socket. the GIL holds a process to about one core, workers get us
+the rest.
+"""
+
+import os
+import sys
+import errno
+import select
+import signal
+import socket
+import threading
+import traceback
+from time import time, sleep
+from Queue import Queue
+
+from thrift.transport import TSocket, TTransport
+from thrift.protocol import TBinaryProtocol
+from thrift.server import TServer, TNonblockingServer
+
+MODELS = ('threaded', 'threadpool', 'nonblocking', 'gevent')
+
+
+class GeventServer(TServer.TServer):
+    """ serves each client connection from it's own greenlet """
+
+    def __init__(self, processor, host, port, tfactory, pfactory,
+                       max_connections=0, listener=None):
+        from gevent import monkey
+        from gevent.pool import Pool
+        from gevent.server import StreamServer
+
+        # w/o the patching every blocking call in a handler would
+        # stall all the other greenlets
+        if not monkey.is_module_patched('socket'):
+            raise ValueError('The gevent model needs gevent.monkey.patch_all()')
+
+        TServer.TServer.__init__(self, processor, None, tfactory, pfactory)
+        spawn = Pool(max_connections) if max_connections else 'default'
+        self.server = StreamServer(listener or (host, port),
+                                   self.handle_socket, spawn=spawn)
+
+    def handle_socket(self, sock, address):
+        client = TSocket.TSocket()
+        client.setHandle(sock)
+        itrans = self.inputTransportFactory.getTransport(client)
+        otrans = self.outputTransportFactory.getTransport(client)
+        iprot = self.inputProtocolFactory.getProtocol(itrans)
+        oprot = self.outputProtocolFactory.getProtocol(otrans)
+        try:
+            while True:
+                self.processor.process(iprot, oprot)
+        except TTransport.TTransportException:
+            pass
+        except Exception, ex:
+            print 'client error: %s: %s' % (address, ex)
+        itrans.close()
+        otrans.close()
+
+    def serve(self):
+        self.server.serve_forever()
+
+    def stop_accepting(self):
+        if not self.server.closed:
+            self.server.close()
+
+
+class SharedServerSocket(TSocket.TServerSocket):
+    """
+    accepts from a socket which is already listening, shared w/ the
+    other worker processes. the socket is non-blocking, whichever
+    worker gets to a connection first takes it.
+    """
+
+    # how often we check if we should still be accepting
+    poll_interval = 1
+
+    def __init__(self, listener):
+        TSocket.TServerSocket.__init__(self)
+        self.handle = listener
+        self.accepting = threading.Event()
+        self.accepting.set()
+
+    def listen(self):
+        # the master already is
+        pass
+
+    def accept(self):
+        while self.accepting.is_set():
+            try:
+                readable = select.select([self.handle], [], [],
+                                         self.poll_interval)[0]
+                # we may have been stopped while we waited
+                if not readable or not self.accepting.is_set():
+                    continue
+                client, addr = self.handle.accept()
+            except (select.error, socket.error), ex:
+                # another worker beat us to it
+                if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                  errno.EINTR):
+                    continue
+                raise
+            client.setblocking(1)
+            result = TSocket.TSocket()
+            result.setHandle(client)
+            return result
+
+        # we're on our way out, leave the connections to the others
+        threading.Event().wait()
+
+    def stop_accepting(self):
+        self.accepting.clear()
+
+
+class BoundedNonblockingServer(TNonblockingServer.TNonblockingServer):
+    """
+    the nonblocking server w/ a cap on the calls waiting for a worker.
+    the select loop queues the calls, so a bounded queue would stall
+    the loop (and every connection's io) on a put once it filled.
+    instead the queue stays unbounded and while queue_size calls are
+    waiting the loop stops accepting and reading, it still writes the
+    answers. a worker taking a call off a full queue wakes the loop
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.queue_size = kwargs.pop('queue_size', 0)
+        TNonblockingServer.TNonblockingServer.__init__(self, *args,
+                                                       **kwargs)
+        self.tasks = _TaskQueue(self)
+
+    def is_full(self):
+        return bool(self.queue_size) and \
+            self.tasks.qsize() >= self.queue_size
+
+    def _select(self):
+        if not self.is_full():
+            return TNonblockingServer.TNonblockingServer._select(self)
+        # only the wake ups and the answers
+        readable = [self._read.fileno()]
+        writable = []
+        for i, connection in self.clients.items():
+            if connection.is_writeable():
+                writable.append(connection.fileno())
+            if connection.is_closed():
+                del self.clients[i]
+        return select.select(readable, writable, readable)
+
+
+class _TaskQueue(Queue):
+    """ unbounded, wakes the server's loop when it stops being full """
+
+    def __init__(self, server):
+        Queue.__init__(self)
+        self.server = server
+
+    def _get(self):
+        task = Queue._get(self)
+        if len(self.queue) + 1 == self.server.queue_size:
+            self.server.wake_up()
+        return task
+
+
+def make_server(service, handler, host='0.0.0.0', port=9090,
+                model='threadpool', workers=10, queue_size=0,
+                listener=None):
+    """
+    returns a thrift server for the handler using the given model.
+
+    workers is the # of threads handling calls (ignored by the threaded
+    model, the most connections served at once for the gevent model),
+    queue_size is how many accepted connections / calls can be
+    waiting on a worker before we stop taking more, 0 for no limit.
+
+    listener is a socket already listening to accept from in place
+    of listening on the host and port
+    """
+
+    processor = service.Processor(handler)
+    if listener is not None:
+        transport = SharedServerSocket(listener)
+    else:
+        transport = TSocket.TServerSocket(host, port)
+    tfactory = TTransport.TBufferedTransportFactory()
+    pfactory = TBinaryProtocol.TBinaryProtocolAcceleratedFactory()
+
+    if model == 'threaded':
+        server = TServer.TThreadedServer(processor, transport,
+                                         tfactory, pfactory,
+                                         daemon=True)
+
+    elif model == 'threadpool':
+        server = TServer.TThreadPoolServer(processor, transport,
+                                           tfactory, pfactory,
+                                           daemon=True)
+        server.setNumThreads(workers)
+        server.clients = Queue(queue_size)
+
+    elif model == 'nonblocking':
+        # framed transport is implied
+        server = BoundedNonblockingServer(processor, transport, pfactory,
+                                          threads=workers,
+                                          queue_size=queue_size)
+
+    elif model == 'gevent':
+        server = GeventServer(processor, host, port, tfactory, pfactory,
+                              max_connections=workers, listener=listener)
+
+    else:
+        raise ValueError('Unknown server model: %s' % model)
+
+    return server
+
+
+def serve(service, handler, host='0.0.0.0', port=9090,
+          model='threadpool', workers=10, queue_size=0):
+    """ serves the handler forever """
+    server = make_server(service, handler, host, port,
+                         model, workers, queue_size)
+    print 'serving %s on %s:%s (%s, %s workers)' % (
+        service.__name__.split('.')[-1], host, port, model, workers)
+    server.serve()
+
+
+class CallTracker(object):
+    """
+    counts the calls a worker process is in the middle of and has
+    handled, flagging the worker to retire after max_requests. the
+    call which hits the limit calls on_retire as it ends
+    """
+
+    def __init__(self, max_requests=0, on_retire=None):
+        self.max_requests = max_requests
+        self.on_retire = on_retire
+        self.cond = threading.Condition()
+        self.active = 0
+        self.handled = 0
+        # set once the worker should stop taking calls
+        self.retire = threading.Event()
+
+    def begin(self):
+        with self.cond:
+            self.active += 1
+
+    def end(self):
+        retiring = False
+        with self.cond:
+            self.active -= 1
+            self.handled += 1
+            if (self.max_requests and self.handled >= self.max_requests
+                and not self.retire.is_set()):
+                self.retire.set()
+                retiring = True
+            if not self.active:
+                self.cond.notify_all()
+        # right away, not when the worker's main loop gets to it
+        if retiring and self.on_retire:
+            self.on_retire()
+
+    def wait_idle(self, timeout):
+        """ waits for the calls in progress, returns False if we gave up """
+        give_up = time() + timeout
+        with self.cond:
+            while self.active and time() < give_up:
+                self.cond.wait(give_up - time())
+            return not self.active
+
+
+class TrackedProtocol(TBinaryProtocol.TBinaryProtocolAccelerated):
+    """
+    reads calls for a TrackedProcessor. a call starts once it's
+    message does, a connection waiting on it's next call is idle
+    """
+
+    def __init__(self, trans, calls):
+        TBinaryProtocol.TBinaryProtocolAccelerated.__init__(self, trans)
+        self.calls = calls
+        self.in_call = False
+
+    def readMessageBegin(self):
+        message = TBinaryProtocol.TBinaryProtocolAccelerated.readMessageBegin(self)
+        self.calls.begin()
+        self.in_call = True
+        return message
+
+
+class TrackedProtocolFactory(object):
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def getProtocol(self, trans):
+        return TrackedProtocol(trans, self.calls)
+
+
+class TrackedProcessor(object):
+    """ wraps a processor, ending the call once it's reply is sent """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def process(self, iprot, oprot):
+        try:
+            return self.processor.process(iprot, oprot)
+        finally:
+            if iprot.in_call:
+                iprot.in_call = False
+                iprot.calls.end()
+
+
+class PreforkServer(object):
+    """
+    forks worker processes which serve from the listening socket we
+    open, keeping processes of them running
+
+    a worker which has handled max_requests calls stops accepting as
+    the call which hit the limit ends, finishes the calls it's in the
+    middle of (waiting up to graceful_timeout) and exits, a fresh one
+    is forked in it's place. the limit isn't exact: calls already
+    running, and ones which come in on it's open connections before
+    they're done, still get handled.
+
+    HUP gracefully restarts all the workers, TERM / INT stops them
+    the same way and exits.
+    """
+
+    def __init__(self, service, make_handler, host='0.0.0.0', port=9090,
+                       model='threadpool', workers=10, queue_size=0,
+                       processes=4, max_requests=0, graceful_timeout=30):
+        if model == 'nonblocking':
+            raise ValueError("The nonblocking model can't be pre-forked")
+
+        self.service = service
+        # builds a worker's handler, after the fork. handlers start
+        # threads and open connections which don't survive one
+        self.make_handler = make_handler
+        self.host = host
+        self.port = port
+        self.model = model
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processes = processes
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+
+        # pid -> when it was forked
+        self.children = {}
+        # pids of workers we've told to stop
+        self.retiring = set()
+        self.running = False
+
+    def serve(self):
+        transport = TSocket.TServerSocket(self.host, self.port)
+        transport.listen()
+        self.listener = transport.handle
+        self.listener.setblocking(0)
+
+        signal.signal(signal.SIGHUP, lambda *a: self.restart())
+        signal.signal(signal.SIGTERM, lambda *a: self.stop())
+        signal.signal(signal.SIGINT, lambda *a: self.stop())
+
+        self.running = True
+        while self.running:
+            self._reap()
+            while self.running and len(self.children) < self.processes:
+                self._spawn()
+            # a signal cuts this short
+            sleep(1)
+
+        self._shutdown()
+
+    def restart(self):
+        """ replaces the workers, each finishing it's calls first """
+        print 'restarting %s workers' % len(self.children)
+        for pid in self.children.keys():
+            self._retire(pid)
+
+    def stop(self):
+        self.running = False
+
+    def _spawn(self):
+        # or the worker would print what we haven't yet
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time()
+            return
+
+        code = 1
+        try:
+            code = self._work()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _retire(self, pid):
+        del self.children[pid]
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                # no children left
+                return
+            if not pid:
+                return
+            if pid in self.children and status:
+                print 'worker %s died: %s' % (pid, status)
+            self.children.pop(pid, None)
+            self.retiring.discard(pid)
+
+    def _shutdown(self):
+        for pid in self.children.keys():
+            self._retire(pid)
+        give_up = time() + self.graceful_timeout + 5
+        while self.retiring and time() < give_up:
+            self._reap()
+            sleep(0.1)
+        for pid in self.retiring:
+            print 'killing worker %s' % pid
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.listener.close()
+
+    def _work(self):
+        """ runs a worker process, returns it's exit code """
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        # ctrl-c hits the whole process group, the master decides
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        calls = CallTracker(self.max_requests)
+        signal.signal(signal.SIGTERM, lambda *a: calls.retire.set())
+
+        handler = self.make_handler()
+        server = make_server(self.service, handler, self.host, self.port,
+                             self.model, self.workers, self.queue_size,
+                             listener=self.listener)
+        server.processor = TrackedProcessor(server.processor)
+        server.inputProtocolFactory = TrackedProtocolFactory(calls)
+
+        def stop_accepting():
+            if isinstance(server, GeventServer):
+                server.stop_accepting()
+            else:
+                server.serverTransport.stop_accepting()
+        calls.on_retire = stop_accepting
+
+        t = threading.Thread(target=server.serve, name='serve')
+        t.daemon = True
+        t.start()
+        print 'worker %s serving' % os.getpid()
+
+        while not calls.retire.is_set():
+            if not t.is_alive():
+                return 1
+            calls.retire.wait(1)
+
+        # already done if we hit max_requests, not for a TERM
+        stop_accepting()
+        if not calls.wait_idle(self.graceful_timeout):
+            print 'worker %s giving up on %s calls' % (os.getpid(),
+                                                       calls.active)
+        shutdown = getattr(handler, 'shutdown', None)
+        if shutdown:
+            shutdown()
+        print 'worker %s done after %s calls' % (os.getpid(), calls.handled)
+        return 0
+
+
+def serve_prefork(service, make_handler, host='0.0.0.0', port=9090,
+                  model='threadpool', workers=10, queue_size=0,
+                  processes=4, max_requests=0, graceful_timeout=30):
+    """
+    serves handlers made by make_handler from processes worker
+    processes, forever. see PreforkServer
+    """
+    server = PreforkServer(service, make_handler, host, port, model,
+                           workers, queue_size, processes, max_requests,
+                           graceful_timeout)
+    print 'serving %s on %s:%s (%s processes, %s, %s workers each)' % (
+        service.__name__.split('.')[-1], host, port, processes, model,
+        workers)
+    server.serve()
@@ -0,0 +1,104 @@
+"""
+keep-alive http sessions, one per origin
+
+each origin (scheme + host + port) gets it's own requests session so
+it's connections get reused between fetches instead of paying for a
+new tcp connection (and tls handshake) every time. sessions which
+haven't been used in a while are closed.
+"""
+
+import threading
+import cookielib
+from time import time
+from urlparse import urlsplit
+from contextlib import contextmanager
+
+import requests
+
+
+class RequestCookiesOnly(cookielib.CookieJar):
+    """
+    a session's cookie jar which never keeps anything. requests saves
+    each request's cookies to it's session, which would send them w/
+    every later request to the origin. cookies are per request here.
+    """
+
+    def set_cookie(self, cookie, *args, **kwargs):
+        pass
+
+
+class SessionPool(object):
+
+    def __init__(self, max_per_host=4, idle_timeout=60):
+        # most connections we'll hold open to a single origin
+        self.max_per_host = max_per_host
+        # seconds a session can sit unused before we close it
+        self.idle_timeout = idle_timeout
+
+        self.lock = threading.Lock()
+        # origin -> [session, last used, # checked out]
+        self.sessions = {}
+        self.last_eviction = time()
+
+    @contextmanager
+    def checkout(self, url):
+        """
+        yields the keep-alive session for the url's origin
+        """
+        origin = self._get_origin(url)
+
+        with self.lock:
+            entry = self.sessions.get(origin)
+            if entry is None:
+                entry = [self._new_session(), time(), 0]
+                self.sessions[origin] = entry
+            entry[2] += 1
+
+        try:
+            yield entry[0]
+        finally:
+            with self.lock:
+                entry[1] = time()
+                entry[2] -= 1
+            self._maybe_evict()
+
+    def evict_idle(self):
+        """
+        closes the sessions no one has used in idle_timeout seconds,
+        returns how many were closed
+        """
+        cutoff = time() - self.idle_timeout
+        with self.lock:
+            idle = [origin for origin, (s, used, out)
+                    in self.sessions.iteritems()
+                    if not out and used < cutoff]
+            closing = [self.sessions.pop(origin)[0] for origin in idle]
+            self.last_eviction = time()
+
+        for session in closing:
+            session.close()
+        return len(closing)
+
+    def close(self):
+        """ closes all the sessions """
+        with self.lock:
+            closing = [entry[0] for entry in self.sessions.itervalues()]
+            self.sessions = {}
+        for session in closing:
+            session.close()
+
+    def _maybe_evict(self):
+        # no need to sweep more often than things can go idle
+        if time() - self.last_eviction > self.idle_timeout:
+            self.evict_idle()
+
+    def _new_session(self):
+        return requests.session(cookies=RequestCookiesOnly(), config={
+            'keep_alive': True,
+            'pool_connections': 1,
+            'pool_maxsize': self.max_per_host
+        })
+
+    def _get_origin(self, url):
+        parsed = urlsplit(url)
+        return (parsed.scheme.lower(), parsed.netloc.lower())
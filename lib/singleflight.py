@@ -0,0 +1,62 @@
+"""
+coalesces concurrent calls for the same key in to one
+
+the first caller for a key becomes the leader and actually does the
+work, anyone asking for the same key while it's in flight waits on
+the leader's result instead of doing the work again.
+"""
+
+import sys
+import threading
+
+from lib.fetcher import FetchFuture
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> future for the call in flight
+        self.flights = {}
+
+    def join(self, key):
+        """
+        returns the future for the key's call and whether we are the
+        leader. the leader must follow up w/ run.
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                return future, False
+            future = self.flights[key] = FetchFuture()
+            return future, True
+
+    def run(self, key, future, fn, *args, **kwargs):
+        """
+        does the work for the key's flight, handing the result to
+        everyone waiting on it
+        """
+        try:
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                # land before anyone waiting wakes up, so a caller
+                # coming right back for the key starts a new flight
+                with self.lock:
+                    if self.flights.get(key) is future:
+                        del self.flights[key]
+            future.set_result(result)
+        except Exception:
+            future.set_exception(sys.exc_info())
+        return future.result()
+
+    def do(self, key, fn, *args, **kwargs):
+        """ calls fn unless someone else already is, returns it's result """
+        future, leader = self.join(key)
+        if leader:
+            return self.run(key, future, fn, *args, **kwargs)
+        return future.result()
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.flights)
@@ -0,0 +1,181 @@
+"""
+process local rate limiting backed by the shared redis limiter
+
+each host gets a local bucket of budget (bytes and requests) leased
+from the shared limiter. checks and usage against the bucket stay in
+process, redis is only touched when a lease runs out / expires and
+when usage past a lease is pushed to it every sync_interval seconds.
+
+a lease is counted as used in the shared limiter when it's taken, so
+other processes can't lease the same budget, and what's left of it
+is handed back to the bucket it was counted in when it expires.
+each lease is at most lease_fraction
+of what the shared limiter says is left, so one process can't take
+all of it. the global limit is only passed by what responses pull
+beyond the lease they started under.
+"""
+
+import threading
+from time import time, sleep
+
+
+class LeasedRateLimiter(object):
+
+    def __init__(self, rl, lease_size=256 * 1024, lease_requests=10,
+                       lease_ttl=1, sync_interval=1, lease_fraction=0.25):
+        # the shared limiter (see lib.hostlimiter)
+        self.rl = rl
+
+        # most budget we take at once and how long we hold it
+        self.lease_size = lease_size
+        self.lease_requests = lease_requests
+        self.lease_ttl = lease_ttl
+        # most of what's left in the shared limiter one lease takes
+        self.lease_fraction = lease_fraction
+
+        self.sync_interval = sync_interval
+
+        self.lock = threading.Lock()
+        # host -> [bytes left, requests left, expires at, bucket it was
+        # counted in], what's left can go negative when a response
+        # overshoots
+        self.leases = {}
+        # host -> [bytes, requests] used past / w/o our leases that
+        # the shared limiter hasn't seen yet
+        self.unsynced = {}
+
+        self.syncer = threading.Thread(target=self._sync_forever,
+                                       name='rate-sync')
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    def allowed(self, host):
+        """
+        returns the bytes we can still pull from the host, 0 if we
+        are out of bytes or requests
+        """
+        with self.lock:
+            lease = self.leases.get(host)
+            if (lease and lease[0] > 0 and lease[1] > 0
+                and lease[2] > time()):
+                return lease[0]
+            # done w/ the old lease, what we used past it is pushed
+            # along w/ the new one
+            refund = lease and self._release(host)
+            unsynced_size, unsynced_requests = self.unsynced.pop(host,
+                                                                 (0, 0))
+        if refund:
+            self._refund(host, refund)
+
+        # out of budget, see if there's more to lease
+        bucket = None
+        try:
+            size, requests = self.rl.remaining(host)
+            size = self._lease(self.lease_size, size - unsynced_size)
+            requests = self._lease(self.lease_requests,
+                                   requests - unsynced_requests)
+            if size <= 0 or requests <= 0:
+                size = requests = 0
+            # it's spent as far as everyone else is concerned
+            if size or unsynced_size or unsynced_requests:
+                bucket = self.rl.add(host, size + unsynced_size,
+                                     requests + unsynced_requests)
+        except Exception, ex:
+            print 'rate lease failed: %s: %s' % (host, ex)
+            with self.lock:
+                self._add_unsynced(host, unsynced_size, unsynced_requests)
+            return 0
+
+        with self.lock:
+            if not size:
+                return 0
+            lease = self.leases.get(host)
+            if lease and lease[2] > time() and lease[3] == bucket:
+                # another thread leased at the same time, pool them
+                lease[0] += size
+                lease[1] += requests
+                return lease[0]
+            refund = lease and self._release(host)
+            self.leases[host] = [size, requests, time() + self.lease_ttl,
+                                 bucket]
+        if refund:
+            self._refund(host, refund)
+        return size
+
+    def consume(self, host, size, requests=1):
+        """ counts what we pulled from the host against it's lease """
+        with self.lock:
+            lease = self.leases.get(host)
+            if lease:
+                lease[0] -= size
+                lease[1] -= requests
+            else:
+                self._add_unsynced(host, size, requests)
+
+    def sync(self, release=False):
+        """
+        hands back what's left of expired leases (all of them if
+        release) and pushes the usage we've been holding to the
+        shared limiter
+        """
+        refunds = []
+        with self.lock:
+            now = time()
+            for host, lease in self.leases.items():
+                if release or lease[2] <= now:
+                    refund = self._release(host)
+                    if refund:
+                        refunds.append((host, refund))
+            unsynced, self.unsynced = self.unsynced, {}
+
+        for host, refund in refunds:
+            self._refund(host, refund)
+
+        for host, (size, requests) in unsynced.iteritems():
+            if not size and not requests:
+                continue
+            try:
+                self.rl.add(host, size, requests)
+            except Exception, ex:
+                print 'rate sync failed: %s: %s' % (host, ex)
+                with self.lock:
+                    self._add_unsynced(host, size, requests)
+
+    def _lease(self, most, remaining):
+        if remaining <= 0:
+            return 0
+        return min(most, max(1, int(remaining * self.lease_fraction)))
+
+    def _release(self, host):
+        """
+        drops the host's lease, returning the (bytes, requests,
+        bucket) we didn't use of it, None if we used it all
+        """
+        size, requests, expires, bucket = self.leases.pop(host)
+        # what we used past it is usage like any other
+        self._add_unsynced(host, max(0, -size), max(0, -requests))
+        if size > 0 or requests > 0:
+            return max(0, size), max(0, requests), bucket
+        return None
+
+    def _refund(self, host, refund):
+        """
+        hands back the unused part of a lease to the bucket it was
+        counted in, once that bucket leaves the window it's moot
+        """
+        size, requests, bucket = refund
+        try:
+            self.rl.add(host, -size, -requests, bucket)
+        except Exception, ex:
+            # we count a little more than we used, that's all
+            print 'rate refund failed: %s: %s' % (host, ex)
+
+    def _add_unsynced(self, host, size, requests):
+        unsynced = self.unsynced.setdefault(host, [0, 0])
+        unsynced[0] += size
+        unsynced[1] += requests
+
+    def _sync_forever(self):
+        while True:
+            sleep(self.sync_interval)
+            self.sync()
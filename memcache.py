@@ -45,9 +45,15 @@ More detailed documentation is available in the L{Client} class.
 
 import sys
 import socket
+import select
+import errno
 import time
 import os
 import re
+import threading
+from bisect import bisect
+from functools import wraps
+from hashlib import md5
 try:
     import cPickle as pickle
 except ImportError:
@@ -63,6 +69,12 @@ def useOldServerHashFunction():
     global serverHashFunction
     serverHashFunction = crc32
 
+def ketama_hash(key, index=0):
+    """Returns the index'th (0-3) 32 bit point from the md5 of the key."""
+    d = md5(key).digest()
+    return ((ord(d[3 + index * 4]) << 24) | (ord(d[2 + index * 4]) << 16) |
+            (ord(d[1 + index * 4]) << 8) | ord(d[index * 4]))
+
 try:
     from zlib import compress, decompress
     _supports_compress = True
@@ -94,6 +106,18 @@ SERVER_MAX_VALUE_LENGTH = 1024*1024
 class _Error(Exception):
     pass
 
+def _releases_connections(fn):
+    """Checks the pooled connections a call used back in once it's done."""
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            if self.pooled:
+                for s in self.servers:
+                    s.release()
+    return wrapper
+
 try:
     # Only exists in Python 2.4+
     from threading import local
@@ -131,6 +155,18 @@ class Client(local):
 
     _SERVER_RETRIES = 10  # how many times to try finding a free server.
 
+    # md5s hashed per server (each gives 4 points on the ketama ring),
+    # multiplied by the server's weight
+    _KETAMA_HASHES = 40
+
+    # how keys are spread across the servers
+    DISTRIBUTIONS = ('modula', 'ketama')
+
+    PROTOCOLS = ('text', 'meta')
+    # storage commands -> meta set modes
+    _META_MODES = {'set': 'S', 'add': 'E', 'replace': 'R',
+                   'append': 'A', 'prepend': 'P'}
+
     # exceptions for Client
     class MemcachedKeyError(Exception):
         pass
@@ -148,7 +184,9 @@ class Client(local):
     def __init__(self, servers, debug=0, pickleProtocol=0,
                  pickler=pickle.Pickler, unpickler=pickle.Unpickler,
                  pload=None, pid=None, server_max_key_length=SERVER_MAX_KEY_LENGTH,
-                 server_max_value_length=SERVER_MAX_VALUE_LENGTH):
+                 server_max_value_length=SERVER_MAX_VALUE_LENGTH,
+                 distribution='modula', pooled=False, pool_max_size=0,
+                 pool_idle_timeout=60, protocol='text'):
         """
         Create a new Client object with the given list of servers.
 
@@ -162,9 +200,35 @@ class Client(local):
         Useful for cPickle since subclassing isn't allowed.
         @param pid: optional persistent_id function to call on pickle storing.
         Useful for cPickle since subclassing isn't allowed.
+        @param distribution: C{'modula'} picks a key's server by it's hash
+        modulo the number of servers. C{'ketama'} uses a consistent hash
+        ring, so adding or removing a server only moves the keys on it's
+        share of the ring.
+        @param pooled: share connections to each server between all threads
+        instead of every thread holding it's own. A thread holds a
+        connection only for the length of a call.
+        @param pool_max_size: most connections open to each server when
+        pooled, 0 for no limit. A call which can't get one w/in the socket
+        timeout treats the server as unavailable.
+        @param pool_idle_timeout: seconds a pooled connection can go unused
+        before it's closed instead of reused.
+        @param protocol: C{'text'} or C{'meta'}. With the meta protocol
+        (memcached 1.6+) gets, sets and deletes use meta commands:
+        multi gets only hear back about hits, multi sets only about
+        failures, and replies are matched up by opaque tokens. incr,
+        decr, gets / cas and stats always use the text protocol.
         """
         local.__init__(self)
         self.debug = debug
+        if distribution not in Client.DISTRIBUTIONS:
+            raise ValueError('Unknown distribution: "%s"' % distribution)
+        self.distribution = distribution
+        self.pooled = pooled
+        self.pool_max_size = pool_max_size
+        self.pool_idle_timeout = pool_idle_timeout
+        if protocol not in Client.PROTOCOLS:
+            raise ValueError('Unknown protocol: "%s"' % protocol)
+        self.protocol = protocol
         self.set_servers(servers)
         self.stats = {}
         self.cas_ids = {}
@@ -196,9 +260,28 @@ class Client(local):
             2. Tuples of the form C{("host:port", weight)}, where C{weight} is
             an integer weight value.
         """
-        self.servers = [_Host(s, self.debug) for s in servers]
+        self.servers = [_Host(s, self.debug, self._get_pool(s))
+                        for s in servers]
         self._init_buckets()
 
+    def _get_pool(self, server):
+        """
+        Returns the connection pool for the server, shared w/ every
+        thread and client using the same server and pool settings.
+        """
+        if not self.pooled:
+            return None
+        pool_key = (server, self.pool_max_size, self.pool_idle_timeout)
+        _pools_lock.acquire()
+        try:
+            if pool_key not in _pools:
+                _pools[pool_key] = _ConnectionPool(self.pool_max_size,
+                                                   self.pool_idle_timeout)
+            return _pools[pool_key]
+        finally:
+            _pools_lock.release()
+
+    @_releases_connections
     def get_stats(self, stat_args = None):
         '''Get statistics from each of the servers.
 
@@ -232,6 +315,7 @@ class Client(local):
 
         return(data)
 
+    @_releases_connections
     def get_slabs(self):
         data = []
         for s in self.servers:
@@ -256,6 +340,7 @@ class Client(local):
                 serverData[slab[1]][slab[2]] = item[2]
         return data
 
+    @_releases_connections
     def flush_all(self):
         'Expire all data currently in the memcache servers.'
         for s in self.servers:
@@ -285,18 +370,75 @@ class Client(local):
         for server in self.servers:
             for i in range(server.weight):
                 self.buckets.append(server)
+        if self.distribution == 'ketama':
+            self._init_ketama()
+
+    def _init_ketama(self):
+        """
+        Builds the ring, each server gets points in proportion to it's
+        weight. The ring is kept as sorted points w/ the server at each,
+        so a key's server is found by bisecting the points. Rings are
+        shared by every client w/ the same servers, a client per thread
+        (or greenlet) would otherwise hash it's own.
+        """
+        ring_key = tuple((s.name(), s.weight) for s in self.servers)
+        if ring_key not in _rings:
+            ring = []
+            for index, server in enumerate(self.servers):
+                for i in range(Client._KETAMA_HASHES * server.weight):
+                    name = '%s-%d' % (server.name(), i)
+                    for j in range(4):
+                        ring.append((ketama_hash(name, j), index))
+            ring.sort()
+            _rings[ring_key] = ([point for point, index in ring],
+                                [index for point, index in ring])
+        self.ketama_points, indexes = _rings[ring_key]
+        self.ketama_servers = [self.servers[i] for i in indexes]
+
+    def _get_ketama_server(self, serverhash, key):
+        """
+        Returns the first server at or clockwise of the hash on the ring,
+        skipping servers which are down.
+        """
+        points = len(self.ketama_points)
+        index = bisect(self.ketama_points, serverhash & 0xffffffff)
+        tried = set()
+        for i in xrange(points):
+            server = self.ketama_servers[(index + i) % points]
+            if server in tried:
+                continue
+            if server.connect():
+                return server, key
+            if not server.deaduntil:
+                # it's up but it's pool is exhausted, it's keys
+                # don't belong anywhere else
+                return None, None
+            tried.add(server)
+            if len(tried) == len(self.servers):
+                break
+        return None, None
 
     def _get_server(self, key):
         if isinstance(key, tuple):
             serverhash, key = key
+        elif self.distribution == 'ketama':
+            serverhash = ketama_hash(key)
         else:
             serverhash = serverHashFunction(key)
 
+        if self.distribution == 'ketama':
+            if not self.ketama_points:
+                return None, None
+            return self._get_ketama_server(serverhash, key)
+
         for i in range(Client._SERVER_RETRIES):
             server = self.buckets[serverhash % len(self.buckets)]
             if server.connect():
                 #print "(using server %s)" % server,
                 return server, key
+            if not server.deaduntil:
+                # pool exhausted, see _get_ketama_server
+                return None, None
             serverhash = serverHashFunction(str(serverhash) + str(i))
         return None, None
 
@@ -304,6 +446,7 @@ class Client(local):
         for s in self.servers:
             s.close_socket()
 
+    @_releases_connections
     def delete_multi(self, keys, time=0, key_prefix=''):
         '''
         Delete multiple keys in the memcache doing just one query.
@@ -335,47 +478,42 @@ class Client(local):
 
         server_keys, prefixed_to_orig_key = self._map_and_prefix_keys(keys, key_prefix)
 
-        # send out all requests on each server before reading anything
-        dead_servers = []
-
-        rc = 1
-        for server in server_keys.iterkeys():
+        # all the servers' deletes go out and come back at once
+        cmds = {}
+        parsers = {}
+        for server, keys in server_keys.iteritems():
             bigcmd = []
             write = bigcmd.append
-            if time != None:
-                 for key in server_keys[server]: # These are mangled keys
+            if self.protocol == 'meta':
+                # quiet, we only hear about failures
+                for i, key in enumerate(keys): # These are mangled keys
+                    write("md %s q O%d\r\n" % (key, i))
+                write("mn\r\n")
+                parsers[server] = self._parse_meta_failures(server, keys,
+                                        prefixed_to_orig_key)
+            elif time != None:
+                 for key in keys: # These are mangled keys
                      write("delete %s %d\r\n" % (key, time))
             else:
-                for key in server_keys[server]: # These are mangled keys
+                for key in keys: # These are mangled keys
                   write("delete %s\r\n" % key)
-            try:
-                server.send_cmds(''.join(bigcmd))
-            except socket.error, msg:
-                rc = 0
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
-                dead_servers.append(server)
+            cmds[server] = ''.join(bigcmd)
+            if server not in parsers:
+                parsers[server] = self._expect_lines(server, len(keys),
+                                                     "DELETED")
 
-        # if any servers died on the way, don't expect them to respond.
-        for server in dead_servers:
-            del server_keys[server]
+        if self._run_multi(cmds, parsers):
+            return 0
+        return 1
 
-        for server, keys in server_keys.iteritems():
-            try:
-                for key in keys:
-                    server.expect("DELETED")
-            except socket.error, msg:
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
-                rc = 0
-        return rc
-
-    def delete(self, key, time=0):
+    @_releases_connections
+    def delete(self, key, time=0, noreply=False):
         '''Deletes a key from the memcache.
 
         @return: Nonzero on success.
         @param time: number of seconds any subsequent set / update commands
-        should fail. Defaults to 0 for no delay.
+        should fail. Defaults to 0 for no delay. Ignored by the meta protocol.
+        @param noreply: don't wait to hear back from the server.
         @rtype: int
         '''
         self.check_key(key)
@@ -383,15 +521,23 @@ class Client(local):
         if not server:
             return 0
         self._statlog('delete')
-        if time != None:
+        if self.protocol == 'meta':
+            cmd = "md %s" % key
+        elif time != None:
             cmd = "delete %s %d" % (key, time)
         else:
             cmd = "delete %s" % key
 
         try:
+            if noreply and self.protocol == 'meta':
+                server.send_noreply(cmd + ' q\r\n')
+                return 1
+            if noreply:
+                server.send_cmd(cmd + ' noreply')
+                return 1
             server.send_cmd(cmd)
             line = server.readline()
-            if line and line.strip() in ['DELETED', 'NOT_FOUND']: return 1
+            if line and line.strip() in ['DELETED', 'NOT_FOUND', 'HD', 'NF']: return 1
             self.debuglog('Delete expected DELETED or NOT_FOUND, got: %s'
                     % repr(line))
         except socket.error, msg:
@@ -399,6 +545,7 @@ class Client(local):
             server.mark_dead(msg)
         return 0
 
+    @_releases_connections
     def incr(self, key, delta=1):
         """
         Sends a command to the server to atomically increment the value
@@ -425,6 +572,7 @@ class Client(local):
         """
         return self._incrdecr("incr", key, delta)
 
+    @_releases_connections
     def decr(self, key, delta=1):
         """
         Like L{incr}, but decrements.  Unlike L{incr}, underflow is checked and
@@ -454,7 +602,8 @@ class Client(local):
             server.mark_dead(msg)
             return None
 
-    def add(self, key, val, time = 0, min_compress_len = 0):
+    @_releases_connections
+    def add(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''
         Add new key with value.
 
@@ -463,9 +612,10 @@ class Client(local):
         @return: Nonzero on success.
         @rtype: int
         '''
-        return self._set("add", key, val, time, min_compress_len)
+        return self._set("add", key, val, time, min_compress_len, noreply)
 
-    def append(self, key, val, time=0, min_compress_len=0):
+    @_releases_connections
+    def append(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''Append the value to the end of the existing key's value.
 
         Only stores in memcache if key already exists.
@@ -474,9 +624,10 @@ class Client(local):
         @return: Nonzero on success.
         @rtype: int
         '''
-        return self._set("append", key, val, time, min_compress_len)
+        return self._set("append", key, val, time, min_compress_len, noreply)
 
-    def prepend(self, key, val, time=0, min_compress_len=0):
+    @_releases_connections
+    def prepend(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''Prepend the value to the beginning of the existing key's value.
 
         Only stores in memcache if key already exists.
@@ -485,9 +636,10 @@ class Client(local):
         @return: Nonzero on success.
         @rtype: int
         '''
-        return self._set("prepend", key, val, time, min_compress_len)
+        return self._set("prepend", key, val, time, min_compress_len, noreply)
 
-    def replace(self, key, val, time=0, min_compress_len=0):
+    @_releases_connections
+    def replace(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''Replace existing key with value.
 
         Like L{set}, but only stores in memcache if the key already exists.
@@ -496,9 +648,10 @@ class Client(local):
         @return: Nonzero on success.
         @rtype: int
         '''
-        return self._set("replace", key, val, time, min_compress_len)
+        return self._set("replace", key, val, time, min_compress_len, noreply)
 
-    def set(self, key, val, time=0, min_compress_len=0):
+    @_releases_connections
+    def set(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''Unconditionally sets a key to a given value in the memcache.
 
         The C{key} can optionally be an tuple, with the first element
@@ -521,11 +674,14 @@ class Client(local):
         attempt at compression yeilds a larger string than the input, then it is
         discarded. For backwards compatability, this parameter defaults to 0,
         indicating don't ever try to compress.
+        @param noreply: don't wait to hear if it was stored, we return 1
+        as soon as it's sent. Also taken by the other storage commands.
         '''
-        return self._set("set", key, val, time, min_compress_len)
+        return self._set("set", key, val, time, min_compress_len, noreply)
 
 
-    def cas(self, key, val, time=0, min_compress_len=0):
+    @_releases_connections
+    def cas(self, key, val, time=0, min_compress_len=0, noreply=False):
         '''Sets a key to a given value in the memcache if it hasn't been
         altered since last fetched. (See L{gets}).
 
@@ -552,7 +708,7 @@ class Client(local):
         backwards compatability, this parameter defaults to 0, indicating
         don't ever try to compress.
         '''
-        return self._set("cas", key, val, time, min_compress_len)
+        return self._set("cas", key, val, time, min_compress_len, noreply)
 
 
     def _map_and_prefix_keys(self, key_iterable, key_prefix):
@@ -594,7 +750,9 @@ class Client(local):
 
         return (server_keys, prefixed_to_orig_key)
 
-    def set_multi(self, mapping, time=0, key_prefix='', min_compress_len=0):
+    @_releases_connections
+    def set_multi(self, mapping, time=0, key_prefix='', min_compress_len=0,
+                  noreply=False):
         '''
         Sets multiple keys in the memcache doing just one query.
 
@@ -630,6 +788,8 @@ class Client(local):
         attempt at compression yeilds a larger string than the input, then it is
         discarded. For backwards compatability, this parameter defaults to 0,
         indicating don't ever try to compress.
+        @param noreply: send the sets w/o waiting to hear if they were stored.
+        Only keys we couldn't send come back as failed.
         @return: List of keys which failed to be stored [ memcache out of memory, etc. ].
         @rtype: list
 
@@ -639,47 +799,61 @@ class Client(local):
 
         server_keys, prefixed_to_orig_key = self._map_and_prefix_keys(mapping.iterkeys(), key_prefix)
 
-        # send out all requests on each server before reading anything
-        dead_servers = []
-        notstored = [] # original keys.
-
-        for server in server_keys.iterkeys():
-            bigcmd = []
-            write = bigcmd.append
-            try:
-                for key in server_keys[server]: # These are mangled keys
-                    store_info = self._val_to_store_info(
-                            mapping[prefixed_to_orig_key[key]],
-                            min_compress_len)
-                    if store_info:
-                        write("set %s %d %d %d\r\n%s\r\n" % (key, store_info[0],
-                                time, store_info[1], store_info[2]))
-                    else:
-                        notstored.append(prefixed_to_orig_key[key])
-                server.send_cmds(''.join(bigcmd))
-            except socket.error, msg:
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
-                dead_servers.append(server)
-
-        # if any servers died on the way, don't expect them to respond.
-        for server in dead_servers:
-            del server_keys[server]
-
         #  short-circuit if there are no servers, just return all keys
         if not server_keys: return(mapping.keys())
 
+        notstored = [] # original keys.
+
+        # all the servers' sets go out and come back at once
+        cmds = {}
+        parsers = {}
+        meta = self.protocol == 'meta'
         for server, keys in server_keys.iteritems():
-            try:
-                for key in keys:
-                    line = server.readline()
-                    if line == 'STORED':
-                        continue
-                    else:
-                        notstored.append(prefixed_to_orig_key[key]) #un-mangle.
-            except (_Error, socket.error), msg:
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
+            bigcmd = []
+            write = bigcmd.append
+            sent = []
+            for key in keys: # These are mangled keys
+                store_info = self._val_to_store_info(
+                        mapping[prefixed_to_orig_key[key]],
+                        min_compress_len)
+                if store_info and meta:
+                    # quiet, we only hear about failures. the opaque
+                    # is the key's index in sent
+                    write("ms %s %d F%d T%d MS q O%d\r\n%s\r\n" % (key,
+                            store_info[1], store_info[0], time, len(sent),
+                            store_info[2]))
+                    sent.append(key)
+                elif store_info:
+                    write("set %s %d %d %d%s\r\n%s\r\n" % (key, store_info[0],
+                            time, store_info[1], noreply and ' noreply' or '',
+                            store_info[2]))
+                    sent.append(key)
+                else:
+                    notstored.append(prefixed_to_orig_key[key])
+            if meta:
+                write("mn\r\n")
+            cmds[server] = ''.join(bigcmd)
+            if noreply:
+                # nothing to read now, a meta batch's replies are
+                # read before the server's next command
+                parsers[server] = iter(())
+            elif meta:
+                parsers[server] = self._parse_meta_failures(server, sent,
+                                        prefixed_to_orig_key, notstored)
+            else:
+                parsers[server] = self._parse_stored(server, sent,
+                                        prefixed_to_orig_key, notstored)
+
+        failed = self._run_multi(cmds, parsers)
+        for server in failed:
+            # it went away mid set, we don't know what made it
+            for key in server_keys[server]:
+                if prefixed_to_orig_key[key] not in notstored:
+                    notstored.append(prefixed_to_orig_key[key])
+        if noreply and meta:
+            for server in server_keys:
+                if server not in failed:
+                    server.pending_noreply += 1
         return notstored
 
     def _val_to_store_info(self, val, min_compress_len):
@@ -728,7 +902,7 @@ class Client(local):
 
         return (flags, len(val), val)
 
-    def _set(self, cmd, key, val, time, min_compress_len = 0):
+    def _set(self, cmd, key, val, time, min_compress_len = 0, noreply=False):
         self.check_key(key)
         server, key = self._get_server(key)
         if not server:
@@ -739,18 +913,34 @@ class Client(local):
         store_info = self._val_to_store_info(val, min_compress_len)
         if not store_info: return(0)
 
+        meta = self.protocol == 'meta' and cmd != 'cas'
         if cmd == 'cas':
             if key not in self.cas_ids:
-                return self._set('set', key, val, time, min_compress_len)
-            fullcmd = "%s %s %d %d %d %d\r\n%s" % (
+                return self._set('set', key, val, time, min_compress_len,
+                                 noreply)
+            fullcmd = "%s %s %d %d %d %d%s\r\n%s" % (
                     cmd, key, store_info[0], time, store_info[1],
-                    self.cas_ids[key], store_info[2])
+                    self.cas_ids[key], noreply and ' noreply' or '',
+                    store_info[2])
+        elif meta:
+            fullcmd = "ms %s %d F%d T%d M%s%s\r\n%s" % (
+                    key, store_info[1], store_info[0], time,
+                    Client._META_MODES[cmd], noreply and ' q' or '',
+                    store_info[2])
         else:
-            fullcmd = "%s %s %d %d %d\r\n%s" % (
-                    cmd, key, store_info[0], time, store_info[1], store_info[2])
+            fullcmd = "%s %s %d %d %d%s\r\n%s" % (
+                    cmd, key, store_info[0], time, store_info[1],
+                    noreply and ' noreply' or '', store_info[2])
 
         try:
+            if noreply and meta:
+                server.send_noreply(fullcmd + '\r\n')
+                return 1
             server.send_cmd(fullcmd)
+            if noreply:
+                return 1
+            if meta:
+                return(server.expect("HD") == "HD")
             return(server.expect("STORED") == "STORED")
         except socket.error, msg:
             if isinstance(msg, tuple): msg = msg[1]
@@ -766,6 +956,14 @@ class Client(local):
         self._statlog(cmd)
 
         try:
+            if cmd == 'get' and self.protocol == 'meta':
+                server.send_cmd("mg %s v f" % key)
+                rlen, flags, opaque = self._expect_meta_value(
+                        server.readline())
+                if rlen is None:
+                    return None
+                return self._recv_value(server, flags, rlen)
+
             server.send_cmd("%s %s" % (cmd, key))
             rkey = flags = rlen = cas_id = None
             if cmd == 'gets':
@@ -785,6 +983,7 @@ class Client(local):
             return None
         return value
 
+    @_releases_connections
     def get(self, key):
         '''Retrieves a key from the memcache.
 
@@ -792,6 +991,7 @@ class Client(local):
         '''
         return self._get('get', key)
 
+    @_releases_connections
     def gets(self, key):
         '''Retrieves a key from the memcache. Used in conjunction with 'cas'.
 
@@ -799,6 +999,7 @@ class Client(local):
         '''
         return self._get('gets', key)
 
+    @_releases_connections
     def get_multi(self, keys, key_prefix=''):
         '''
         Retrieves multiple keys from the memcache doing just one query.
@@ -841,35 +1042,211 @@ class Client(local):
 
         server_keys, prefixed_to_orig_key = self._map_and_prefix_keys(keys, key_prefix)
 
-        # send out all requests on each server before reading anything
-        dead_servers = []
-        for server in server_keys.iterkeys():
-            try:
-                server.send_cmd("get %s" % " ".join(server_keys[server]))
-            except socket.error, msg:
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
-                dead_servers.append(server)
+        # ask all the servers at once, reading replies as they come in
+        retvals = {}
+        cmds = {}
+        parsers = {}
+        for server, keys in server_keys.iteritems():
+            if self.protocol == 'meta':
+                # quiet, misses don't answer. the opaque is the
+                # key's index in keys
+                cmds[server] = "%smn\r\n" % "".join(
+                        "mg %s v f q O%d\r\n" % (key, i)
+                        for i, key in enumerate(keys))
+                parsers[server] = self._parse_meta_values(server, keys,
+                                        prefixed_to_orig_key, retvals)
+            else:
+                cmds[server] = "get %s\r\n" % " ".join(keys)
+                parsers[server] = self._parse_values(server,
+                                        prefixed_to_orig_key, retvals)
+        self._run_multi(cmds, parsers)
+        return retvals
 
-        # if any servers died on the way, don't expect them to respond.
-        for server in dead_servers:
-            del server_keys[server]
+    def _run_multi(self, cmds, parsers):
+        """
+        Sends each server it's commands and feeds it's replies to it's
+        parser as they arrive, talking to all the servers at once
+        instead of one after another.
+
+        @param cmds: server -> commands, w/ their trailing \\r\\n's
+        @param parsers: server -> generator which reads the server's
+        replies from it's buffer, yielding when it needs more
+        @return: The servers which failed, they are marked dead.
+        @rtype: list
+        """
+        pending = dict((s, [cmd, 0]) for s, cmd in cmds.iteritems() if cmd)
+        reading = dict(parsers)
+        failed = []
 
-        retvals = {}
-        for server in server_keys.iterkeys():
+        def fail(server, msg):
+            if isinstance(msg, tuple): msg = msg[1]
+            server.mark_dead(msg)
+            failed.append(server)
+            pending.pop(server, None)
+            reading.pop(server, None)
+
+        # replies still owed for noreply commands come first. the
+        # connection may have gone away since (memcached restarted)
+        for server in cmds.keys():
             try:
-                line = server.readline()
-                while line and line != 'END':
-                    rkey, flags, rlen = self._expectvalue(server, line)
-                    #  Bo Yang reports that this can sometimes be None
-                    if rkey is not None:
-                        val = self._recv_value(server, flags, rlen)
-                        retvals[prefixed_to_orig_key[rkey]] = val   # un-prefix returned key.
-                    line = server.readline()
+                server.drain()
             except (_Error, socket.error), msg:
-                if isinstance(msg, tuple): msg = msg[1]
-                server.mark_dead(msg)
-        return retvals
+                fail(server, msg)
+                continue
+            if not server.socket:
+                fail(server, 'Connection lost reading noreply replies')
+
+        # only the servers still w/ us, a failed one's socket is closed
+        by_socket = dict((s.socket, s) for s in cmds
+                         if s not in failed and s.socket)
+
+        # anything already buffered gets parsed, a parser w/ nothing
+        # to read is done before we start
+        for server, parser in parsers.iteritems():
+            if server in failed:
+                continue
+            try:
+                parser.next()
+            except StopIteration:
+                del reading[server]
+            except _Error, msg:
+                fail(server, msg)
+
+        for sock in by_socket:
+            sock.setblocking(0)
+        try:
+            while pending or reading:
+                try:
+                    readable, writable, _ = select.select(
+                            [s.socket for s in reading],
+                            [s.socket for s in pending], [],
+                            _Host._SOCKET_TIMEOUT)
+                except select.error, msg:
+                    if msg[0] == errno.EINTR:
+                        continue
+                    raise
+                if not readable and not writable:
+                    for server in set(pending) | set(reading):
+                        fail(server, 'timed out')
+                    break
+
+                for sock in writable:
+                    server = by_socket[sock]
+                    out = pending[server]
+                    try:
+                        out[1] += sock.send(buffer(out[0], out[1]))
+                    except socket.error, msg:
+                        if msg[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                            fail(server, msg)
+                        continue
+                    if out[1] >= len(out[0]):
+                        del pending[server]
+
+                for sock in readable:
+                    server = by_socket[sock]
+                    if server not in reading:
+                        continue
+                    try:
+                        if not server.fill():
+                            raise _Error('Connection closed while '
+                                         'reading from %s' % server)
+                        reading[server].next()
+                    except StopIteration:
+                        del reading[server]
+                    except (_Error, socket.error), msg:
+                        fail(server, msg)
+        finally:
+            for sock, server in by_socket.iteritems():
+                if server.socket is sock:
+                    sock.settimeout(server._SOCKET_TIMEOUT)
+        return failed
+
+    def _parse_values(self, server, prefixed_to_orig_key, retvals):
+        """ reads the VALUE replies to a get from the server's buffer """
+        while True:
+            line = server.buffered_readline()
+            while line is None:
+                yield
+                line = server.buffered_readline()
+            if line == 'END':
+                return
+            rkey, flags, rlen = self._expectvalue(server, line)
+            #  Bo Yang reports that this can sometimes be None
+            if rkey is None:
+                continue
+            buf = server.buffered_recv(rlen, 2)
+            while buf is None:
+                yield
+                buf = server.buffered_recv(rlen, 2)
+            val = self._decode_value(buf, flags)
+            retvals[prefixed_to_orig_key[rkey]] = val   # un-prefix returned key.
+
+    def _parse_meta_values(self, server, keys, prefixed_to_orig_key,
+                           retvals):
+        """ reads the replies to quiet meta gets, up to the MN """
+        while True:
+            line = server.buffered_readline()
+            while line is None:
+                yield
+                line = server.buffered_readline()
+            if line == 'MN':
+                return
+            rlen, flags, opaque = self._expect_meta_value(line)
+            if rlen is None:
+                self.debuglog("unexpected meta get response '%s'" % line)
+                continue
+            buf = server.buffered_recv(rlen, 2)
+            while buf is None:
+                yield
+                buf = server.buffered_recv(rlen, 2)
+            key = self._opaque_key(keys, opaque, line)
+            retvals[prefixed_to_orig_key[key]] = self._decode_value(buf, flags)
+
+    def _parse_meta_failures(self, server, keys, prefixed_to_orig_key,
+                             failures=None):
+        """
+        reads the replies to quiet meta commands, up to the MN. only
+        failures answer, their keys go in failures if it's given
+        """
+        while True:
+            line = server.buffered_readline()
+            while line is None:
+                yield
+                line = server.buffered_readline()
+            if line == 'MN':
+                return
+            self.debuglog("meta command failed '%s'" % line)
+            if failures is not None:
+                opaque = [p[1:] for p in line.split()[1:] if p[0] == 'O']
+                key = self._opaque_key(keys, opaque and opaque[0], line)
+                failures.append(prefixed_to_orig_key[key]) #un-mangle.
+
+    def _opaque_key(self, keys, opaque, line):
+        try:
+            return keys[int(opaque)]
+        except (TypeError, ValueError, IndexError):
+            raise _Error("no key for meta response '%s'" % line)
+
+    def _parse_stored(self, server, keys, prefixed_to_orig_key, notstored):
+        """ reads the replies to sets of the keys from the server's buffer """
+        for key in keys:
+            line = server.buffered_readline()
+            while line is None:
+                yield
+                line = server.buffered_readline()
+            if line != 'STORED':
+                notstored.append(prefixed_to_orig_key[key]) #un-mangle.
+
+    def _expect_lines(self, server, count, text):
+        """ reads count lines from the server's buffer, logging any but text """
+        for i in xrange(count):
+            line = server.buffered_readline()
+            while line is None:
+                yield
+                line = server.buffered_readline()
+            if line != text:
+                self.debuglog("while expecting '%s', got unexpected "
+                              "response '%s'" % (text, line))
 
     def _expect_cas_value(self, server, line=None):
         if not line:
@@ -881,6 +1258,20 @@ class Client(local):
         else:
             return (None, None, None, None)
 
+    def _expect_meta_value(self, line):
+        """ Returns (length, flags, opaque) from a meta VA line """
+        if not line or line[:3] != 'VA ':
+            return (None, None, None)
+        parts = line.split()
+        flags = 0
+        opaque = None
+        for part in parts[2:]:
+            if part[0] == 'f':
+                flags = int(part[1:])
+            elif part[0] == 'O':
+                opaque = part[1:]
+        return (int(parts[1]), flags, opaque)
+
     def _expectvalue(self, server, line=None):
         if not line:
             line = server.readline()
@@ -894,15 +1285,11 @@ class Client(local):
             return (None, None, None)
 
     def _recv_value(self, server, flags, rlen):
-        rlen += 2 # include \r\n
-        buf = server.recv(rlen)
-        if len(buf) != rlen:
-            raise _Error("received %d bytes when expecting %d"
-                    % (len(buf), rlen))
-
-        if len(buf) == rlen:
-            buf = buf[:-2]  # strip \r\n
+        # the value is copied out of what we read once, w/o it's \r\n
+        buf = server.recv_value(rlen)
+        return self._decode_value(buf, flags)
 
+    def _decode_value(self, buf, flags):
         if flags & Client._FLAG_COMPRESSED:
             buf = decompress(buf)
 
@@ -961,9 +1348,12 @@ class Client(local):
 class _Host(object):
     _DEAD_RETRY = 30  # number of seconds before retrying a dead server.
     _SOCKET_TIMEOUT = 3  #  number of seconds before sockets timeout.
+    _RECV_SIZE = 64 * 1024  # how much we ask the socket for at once.
+    _MAX_KEPT_BUFFER = 2 * 1024 * 1024  # most receive buffer we hold on to.
 
-    def __init__(self, host, debug=0):
+    def __init__(self, host, debug=0, pool=None):
         self.debug = debug
+        self.pool = pool
         if isinstance(host, tuple):
             host, self.weight = host
         else:
@@ -991,7 +1381,15 @@ class _Host(object):
         self.deaduntil = 0
         self.socket = None
 
-        self.buffer = ''
+        # replies are read in to rbuf, the unread part is
+        # rbuf[rstart:rend]. it's allocated once we have a connection,
+        # a pooled host hands it back w/ the connection so idle clients
+        # (one per thread or greenlet) don't each hold one
+        self.rbuf = bytearray()
+        self._reset_buffer()
+        # meta noreply batches sent w/o waiting, each is followed by
+        # an mn whose MN we read before our next command
+        self.pending_noreply = 0
 
     def debuglog(self, str):
         if self.debug:
@@ -1018,6 +1416,24 @@ class _Host(object):
             return None
         if self.socket:
             return self.socket
+        pending, rbuf = 0, None
+        if self.pool:
+            s, pending, rbuf = self.pool.checkout(self._connect,
+                                                  self._SOCKET_TIMEOUT)
+        else:
+            s = self._connect()
+        if not s:
+            return None
+        self.socket = s
+        if rbuf is not None:
+            self.rbuf = rbuf
+        elif not self.rbuf:
+            self.rbuf = bytearray(self._RECV_SIZE)
+        self._reset_buffer()
+        self.pending_noreply = pending
+        return s
+
+    def _connect(self):
         s = socket.socket(self.family, socket.SOCK_STREAM)
         if hasattr(s, 'settimeout'): s.settimeout(self._SOCKET_TIMEOUT)
         try:
@@ -1029,38 +1445,157 @@ class _Host(object):
             if isinstance(msg, tuple): msg = msg[1]
             self.mark_dead("connect: %s" % msg[1])
             return None
-        self.socket = s
-        self.buffer = ''
         return s
 
     def close_socket(self):
         if self.socket:
-            self.socket.close()
+            if self.pool:
+                self.pool.discard(self.socket)
+                self.rbuf = bytearray()
+            else:
+                self.socket.close()
             self.socket = None
+        self.pending_noreply = 0
+
+    def release(self):
+        """ Checks our pooled connection back in to the pool """
+        if not self.pool or not self.socket:
+            return
+        if self.buffered():
+            # a reply we didn't read, no one else can use it
+            self.close_socket()
+        else:
+            self._reset_buffer()
+            self.pool.checkin(self.socket, self.pending_noreply, self.rbuf)
+            self.socket = None
+            self.rbuf = bytearray()
+        self._reset_buffer()
+        self.pending_noreply = 0
 
     def send_cmd(self, cmd):
+        self.drain()
         self.socket.sendall(cmd + '\r\n')
 
     def send_cmds(self, cmds):
         """ cmds already has trailing \r\n's applied """
+        self.drain()
         self.socket.sendall(cmds)
 
+    def send_noreply(self, cmds):
+        """
+        Sends quiet meta commands w/o waiting on them. An mn follows so
+        we can tell where any failures they report end.
+        """
+        self.send_cmds(cmds + 'mn\r\n')
+        self.pending_noreply += 1
+
+    def drain(self):
+        """ Reads the replies owed for noreply commands, logging failures """
+        while self.pending_noreply:
+            line = self.readline()
+            if not line:
+                return
+            if line == 'MN':
+                self.pending_noreply -= 1
+            else:
+                self.debuglog('noreply command failed: %s' % line)
+
+    def _reset_buffer(self):
+        # drops what's buffered, the buffer itself is reused unless a
+        # big value grew it past what we hold on to
+        if len(self.rbuf) > self._MAX_KEPT_BUFFER:
+            self.rbuf = bytearray(self._RECV_SIZE)
+        self.rstart = self.rend = 0
+        # how much the multi call parser is waiting for
+        self.wanted = 0
+
+    def buffered(self):
+        """ Returns how many read bytes we haven't handed out yet """
+        return self.rend - self.rstart
+
+    def _take(self, n, skip=0):
+        """ Returns the next n buffered bytes, w/ one copy, dropping skip more """
+        data = memoryview(self.rbuf)[self.rstart:self.rstart + n].tobytes()
+        self.rstart += n + skip
+        if self.rstart >= self.rend:
+            self.rstart = self.rend = 0
+            # don't hold on to the room a big value needed
+            if len(self.rbuf) > self._MAX_KEPT_BUFFER:
+                self.rbuf = bytearray(self._RECV_SIZE)
+        return data
+
+    def _recv_into_buffer(self, size):
+        """ Reads up to size more bytes on to the end of the buffer """
+        if len(self.rbuf) - self.rend < size:
+            have = self.rend - self.rstart
+            if len(self.rbuf) >= have + size:
+                # there's room once what's left moves to the front
+                self.rbuf[:have] = self.rbuf[self.rstart:self.rend]
+            else:
+                rbuf = bytearray(have + size)
+                memoryview(rbuf)[:have] = \
+                    memoryview(self.rbuf)[self.rstart:self.rend]
+                self.rbuf = rbuf
+            self.rstart, self.rend = 0, have
+        n = self.socket.recv_into(memoryview(self.rbuf)[self.rend:], size)
+        self.rend += n
+        return n
+
+    def _fill_to(self, rlen):
+        """
+        Reads until rlen bytes are buffered, asking the socket for
+        just what's missing so the buffer only grows once.
+        """
+        while self.buffered() < rlen:
+            if not self._recv_into_buffer(rlen - self.buffered()):
+                raise _Error( 'Read %d bytes, expecting %d, '
+                        'read returned 0 length bytes'
+                        % ( self.buffered(), rlen ))
+
     def readline(self):
-        buf = self.buffer
-        recv = self.socket.recv
         while True:
-            index = buf.find('\r\n')
+            index = self.rbuf.find('\r\n', self.rstart, self.rend)
             if index >= 0:
                 break
-            data = recv(4096)
-            if not data:
+            if not self._recv_into_buffer(self._RECV_SIZE):
                 self.mark_dead('Connection closed while reading from %s'
                         % repr(self))
-                self.buffer = ''
+                self._reset_buffer()
                 return ''
-            buf += data
-        self.buffer = buf[index+2:]
-        return buf[:index]
+        return self._take(index - self.rstart, 2)
+
+    def fill(self):
+        """
+        Reads whatever the (non-blocking) socket has for us in to the
+        buffer, at least as much as the parser is waiting for if it
+        will fit. Returns False if the server closed the connection.
+        """
+        size = max(self._RECV_SIZE, self.wanted - self.buffered())
+        try:
+            n = self._recv_into_buffer(size)
+        except socket.error, msg:
+            if msg[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            raise
+        return n > 0
+
+    def buffered_readline(self):
+        """ Returns the next line in the buffer, None if there isn't one yet """
+        index = self.rbuf.find('\r\n', self.rstart, self.rend)
+        if index < 0:
+            return None
+        return self._take(index - self.rstart, 2)
+
+    def buffered_recv(self, rlen, skip=0):
+        """
+        Returns rlen bytes from the buffer, followed by skip bytes we
+        drop. None if it doesn't have them yet.
+        """
+        if self.buffered() < rlen + skip:
+            self.wanted = rlen + skip
+            return None
+        self.wanted = 0
+        return self._take(rlen, skip)
 
     def expect(self, text):
         line = self.readline()
@@ -1070,16 +1605,19 @@ class _Host(object):
         return line
 
     def recv(self, rlen):
-        self_socket_recv = self.socket.recv
-        buf = self.buffer
-        while len(buf) < rlen:
-            foo = self_socket_recv(max(rlen - len(buf), 4096))
-            buf += foo
-            if not foo:
-                raise _Error( 'Read %d bytes, expecting %d, '
-                        'read returned 0 length bytes' % ( len(buf), rlen ))
-        self.buffer = buf[rlen:]
-        return buf[:rlen]
+        self._fill_to(rlen)
+        return self._take(rlen)
+
+    def recv_value(self, rlen):
+        """ Returns a value of rlen bytes, dropping the \\r\\n after it """
+        self._fill_to(rlen + 2)
+        return self._take(rlen, 2)
+
+    def name(self):
+        """ Returns the server's address, as used to place it on the ketama ring """
+        if self.family == socket.AF_INET:
+            return "%s:%d" % self.address
+        return self.address
 
     def __str__(self):
         d = ''
@@ -1092,6 +1630,103 @@ class _Host(object):
             return "unix:%s%s" % (self.address, d)
 
 
+_pools = {}
+_pools_lock = threading.Lock()
+
+# (server name, weight)s -> (ketama points, index of the server at each)
+_rings = {}
+
+class _ConnectionPool(object):
+    """
+    Connections to one server shared between threads. Connections are
+    checked out for the length of a call and checked back in after.
+    """
+
+    def __init__(self, max_size=0, idle_timeout=60):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition(threading.Lock())
+        # (socket, checked in at, noreply batches it still owes an
+        # MN for, it's receive buffer), most recently used last
+        self.idle = []
+        # sockets open, checked out or idle
+        self.size = 0
+
+    def checkout(self, connect, timeout):
+        """
+        Returns (connection, MNs it owes, receive buffer) for an idle
+        connection which is still good, or one from connect (w/ no
+        buffer yet) if we are under the max size. The connection is
+        None if none frees up w/in the timeout or connect fails.
+        """
+        give_up = time.time() + timeout
+        self.cond.acquire()
+        try:
+            while True:
+                while self.idle:
+                    s, checked_in, pending, rbuf = self.idle.pop()
+                    if self._healthy(s, checked_in, pending):
+                        return s, pending, rbuf
+                    self._close(s)
+                if not self.max_size or self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = give_up - time.time()
+                if remaining <= 0:
+                    return None, 0, None
+                self.cond.wait(remaining)
+        finally:
+            self.cond.release()
+
+        s = None
+        try:
+            s = connect()
+        finally:
+            if not s:
+                self._forget()
+        return s, 0, None
+
+    def checkin(self, s, pending=0, rbuf=None):
+        self.cond.acquire()
+        try:
+            self.idle.append((s, time.time(), pending, rbuf))
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def discard(self, s):
+        """ Closes a checked out connection which isn't any good """
+        s.close()
+        self._forget()
+
+    def _forget(self):
+        self.cond.acquire()
+        try:
+            self.size -= 1
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def _close(self, s):
+        # the lock is held
+        s.close()
+        self.size -= 1
+
+    def _healthy(self, s, checked_in, pending=0):
+        if self.idle_timeout and time.time() - checked_in > self.idle_timeout:
+            return False
+        if pending:
+            # it's owed replies, there should be something to read
+            return True
+        # an idle connection has nothing to read, unless the server
+        # closed it (or sent something we never asked for)
+        try:
+            readable, _, _ = select.select([s], [], [], 0)
+        except (select.error, socket.error):
+            return False
+        return not readable
+
+
 def _doctest():
     import doctest, memcache
     servers = ["127.0.0.1:11211"]
@@ -22,7 +22,22 @@ struct Response {
     5: optional bool from_cache,
     6: optional double response_time,
     7: optional double timestamp,
-    8: optional map<string,string> cookies
+    8: optional map<string,string> cookies,
+    9: optional bool truncated,
+    10: optional string stream_id
+}
+
+/* a piece of a streamed response's body */
+struct StreamChunk {
+    1: string stream_id,
+    2: string data,
+    3: bool eof
+}
+
+/* one slot of a batch, either the response or why it failed */
+struct BatchResponse {
+    1: optional Response response,
+    2: optional Exception ex
 }
 
 
@@ -30,4 +45,19 @@ service Requester {
     /* does http request for resorce */
     Response urlopen(1: Request request)
     throws (1: Exception ex)
+
+    /* does http requests for many resources, results in request order */
+    list<BatchResponse> urlopen_multi(1: list<Request> requests)
+    throws (1: Exception ex)
+
+    /* starts an http request whose body is read w/ read_stream,
+       the response has no content but carries the stream's id */
+    Response urlopen_stream(1: Request request)
+    throws (1: Exception ex)
+
+    /* returns up to max_bytes more of the stream's body, 0 for the
+       server's read size. the server caps a read at 1MB, ask again
+       for more */
+    StreamChunk read_stream(1: string stream_id, 2: i32 max_bytes)
+    throws (1: Exception ex)
 }
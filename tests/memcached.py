@@ -0,0 +1,143 @@
+"""
+a little memcached for the tests, speaking enough of the text and
+meta protocols for memcache.Client. runs in a thread, on a port of
+it's own unless it's given one (to stand in for a restarted server).
+"""
+
+import socket
+import threading
+
+
+class FakeMemcached(object):
+
+    def __init__(self, port=0):
+        self.data = {}
+        # the expiry each key was last stored w/, not enforced
+        self.ttls = {}
+        self.lock = threading.Lock()
+        self.clients = []
+
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(50)
+        self.port = self.listener.getsockname()[1]
+        self.address = '127.0.0.1:%s' % self.port
+
+        t = threading.Thread(target=self._accept)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """ goes away like a killed memcached, connections and all """
+        # a close alone leaves the accept blocked and the port bound
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listener.close()
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            client.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, address = self.listener.accept()
+            except socket.error:
+                return
+            self.clients.append(client)
+            t = threading.Thread(target=self._serve, args=(client,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, client):
+        f = client.makefile('rb')
+        while True:
+            try:
+                line = f.readline()
+            except socket.error:
+                return
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                continue
+            with self.lock:
+                reply = self._command(parts, f)
+            try:
+                client.sendall(reply)
+            except socket.error:
+                return
+
+    def _command(self, parts, f):
+        cmd, args = parts[0], parts[1:]
+        if cmd in ('get', 'gets'):
+            out = []
+            for key in args:
+                if key in self.data:
+                    flags, value = self.data[key]
+                    out.append('VALUE %s %s %s\r\n%s\r\n'
+                               % (key, flags, len(value), value))
+            return ''.join(out) + 'END\r\n'
+
+        if cmd in ('set', 'add', 'replace'):
+            key, flags, exptime, length = args[:4]
+            value = f.read(int(length) + 2)[:-2]
+            stored = self._store(cmd[0].upper() if cmd != 'set' else 'S',
+                                 key, int(flags), value, int(exptime))
+            if 'noreply' in args:
+                return ''
+            return 'STORED\r\n' if stored else 'NOT_STORED\r\n'
+
+        if cmd == 'delete':
+            found = self.data.pop(args[0], None) is not None
+            if 'noreply' in args:
+                return ''
+            return 'DELETED\r\n' if found else 'NOT_FOUND\r\n'
+
+        if cmd == 'mg':
+            key, flags = args[0], args[1:]
+            opaque = ''.join(' ' + x for x in flags if x[0] == 'O')
+            if key not in self.data:
+                return '' if 'q' in flags else 'EN\r\n'
+            client_flags, value = self.data[key]
+            return 'VA %s f%s%s\r\n%s\r\n' % (len(value), client_flags,
+                                              opaque, value)
+
+        if cmd == 'ms':
+            key, length, flags = args[0], int(args[1]), args[2:]
+            value = f.read(length + 2)[:-2]
+            client_flags = ([int(x[1:]) for x in flags if x[0] == 'F']
+                            or [0])[0]
+            mode = ([x[1:] for x in flags if x[0] == 'M'] or ['S'])[0]
+            ttl = ([int(x[1:]) for x in flags if x[0] == 'T'] or [0])[0]
+            stored = self._store(mode, key, client_flags, value, ttl)
+            if stored and 'q' in flags:
+                return ''
+            opaque = ''.join(' ' + x for x in flags if x[0] == 'O')
+            return '%s%s\r\n' % ('HD' if stored else 'NS', opaque)
+
+        if cmd == 'md':
+            found = self.data.pop(args[0], None) is not None
+            if 'q' in args:
+                return ''
+            return 'HD\r\n' if found else 'NF\r\n'
+
+        if cmd == 'mn':
+            return 'MN\r\n'
+
+        return 'ERROR\r\n'
+
+    def _store(self, mode, key, flags, value, ttl=0):
+        # S set, E add, R replace
+        if mode == 'E' and key in self.data:
+            return False
+        if mode == 'R' and key not in self.data:
+            return False
+        self.data[key] = (flags, value)
+        self.ttls[key] = ttl
+        return True
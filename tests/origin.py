@@ -0,0 +1,66 @@
+"""
+a little http origin for the handler tests. each path answers w/
+whatever response was set for it (200 'hello', fresh for a minute,
+if none was) and every request is recorded as (method, path, body).
+"""
+
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        self.server.requests.append((self.command, self.path, body))
+
+        status, headers, content = self.server.responses.get(
+            self.path, self.server.default)
+        if callable(content):
+            content = content()
+        self.send_response(status)
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class Origin(object):
+
+    default = (200, {'Cache-Control': 'max-age=60'}, 'hello')
+
+    def __init__(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.requests = self.requests = []
+        self.server.responses = self.responses = {}
+        self.server.default = self.default
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+
+    def respond(self, path, status=200, headers=None, content='hello'):
+        """ sets what the path answers w/, content can be a callable """
+        self.responses[path] = (status, headers or {}, content)
+
+    def hits(self, method=None):
+        return [r for r in self.requests if method in (None, r[0])]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,84 @@
+import unittest
+
+from lib import helpers
+from lib.helpers import fixurl, canonical_url
+
+
+class FixUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        helpers.fixed_urls.clear()
+        helpers.encoded_hosts.clear()
+
+    def test_safe_urls_come_back_as_is(self):
+        for url in ('http://example.com',
+                    'http://example.com/',
+                    'https://www.example.com:8080/a/b_c/d.html',
+                    'http://example.com/search?q=x&page=2'):
+            self.assertEqual(fixurl(url), url)
+            self.assertEqual(fixurl(url), helpers._fixurl(url))
+        # the fast path doesn't bother w/ the memo
+        self.assertEqual(len(helpers.fixed_urls), 0)
+
+    def test_quoting(self):
+        self.assertEqual(fixurl('http://example.com/a b/c'),
+                         'http://example.com/a%20b/c')
+        self.assertEqual(fixurl('http://example.com/caf\xc3\xa9'),
+                         'http://example.com/caf%C3%A9')
+        self.assertEqual(fixurl(u'http://example.com/caf\xe9'),
+                         'http://example.com/caf%C3%A9')
+        self.assertEqual(fixurl('http://example.com/?q=a b'),
+                         'http://example.com/?q=a%20b')
+        # already quoted stays the same
+        self.assertEqual(fixurl('http://example.com/a%20b'),
+                         'http://example.com/a%20b')
+
+    def test_encoded_slash_stays_encoded(self):
+        self.assertEqual(fixurl('http://example.com/a%2fb'),
+                         'http://example.com/a%2Fb')
+
+    def test_idna_host(self):
+        self.assertEqual(fixurl(u'http://\u4f8b\u3048.jp/'),
+                         'http://xn--r8jz45g.jp/')
+        self.assertEqual(fixurl(u'http://user:pw@\u4f8b\u3048.jp:81/'),
+                         'http://user:pw@xn--r8jz45g.jp:81/')
+        self.assertEqual(helpers.encoded_hosts.get(u'\u4f8b\u3048.jp'),
+                         'xn--r8jz45g.jp')
+
+    def test_memo(self):
+        url = 'http://example.com/a b'
+        fixed = fixurl(url)
+        self.assertEqual(helpers.fixed_urls.get(url), fixed)
+        self.assertTrue(fixurl(url) is fixed)
+
+    def test_returns_str(self):
+        self.assertTrue(type(fixurl(u'http://example.com/')) is str)
+        self.assertTrue(type(fixurl(u'http://example.com/a b')) is str)
+
+
+class CanonicalUrlTest(unittest.TestCase):
+
+    def test_same_however_written(self):
+        urls = ['http://Example.COM/a?b=2&a=1',
+                'HTTP://example.com:80/a?a=1&b=2#top',
+                'http://example.com/a?a=1&&b=2']
+        self.assertEqual(set(canonical_url(u) for u in urls),
+                         set(['http://example.com/a?a=1&b=2']))
+
+    def test_empty_path(self):
+        self.assertEqual(canonical_url('http://example.com'),
+                         'http://example.com/')
+
+    def test_other_port_kept(self):
+        self.assertEqual(canonical_url('https://example.com:80/'),
+                         'https://example.com:80/')
+        self.assertEqual(canonical_url('https://example.com:443/'),
+                         'https://example.com/')
+
+    def test_path_case_kept(self):
+        self.assertEqual(canonical_url('http://example.com/A'),
+                         'http://example.com/A')
+
+
+if __name__ == '__main__':
+    unittest.main()
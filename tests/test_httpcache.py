@@ -0,0 +1,179 @@
+import unittest
+from email.utils import formatdate
+
+from lib import httpcache
+from tgen.requester.ttypes import Response
+
+NOW = 1350000000.0
+
+
+def response(age=0, status_code=200, **headers):
+    headers = dict((k.replace('_', '-'), v) for k, v in headers.iteritems())
+    return Response(url='http://example.com/', status_code=status_code,
+                    headers=headers, content='', timestamp=NOW - age)
+
+
+class CacheControlTest(unittest.TestCase):
+
+    def test_parse(self):
+        r = response(cache_control='Max-Age=60, no-transform, foo="bar"')
+        self.assertEqual(httpcache.parse_cache_control(r.headers),
+                         {'max-age': '60', 'no-transform': True,
+                          'foo': 'bar'})
+
+    def test_header_case(self):
+        self.assertEqual(httpcache.get_header({'ETag': 'x'}, 'etag'), 'x')
+        self.assertEqual(httpcache.get_header(None, 'etag', 1), 1)
+
+    def test_is_cacheable(self):
+        self.assertTrue(httpcache.is_cacheable(response()))
+        self.assertFalse(httpcache.is_cacheable(
+            response(cache_control='no-store')))
+        self.assertFalse(httpcache.is_cacheable(response(vary='*')))
+        self.assertTrue(httpcache.is_cacheable(
+            response(vary='Accept-Encoding')))
+
+    def test_private_is_not_cacheable(self):
+        self.assertFalse(httpcache.is_cacheable(
+            response(cache_control='private, max-age=60')))
+
+    def test_errors_are_not_cacheable(self):
+        for status in (500, 502, 503):
+            self.assertFalse(httpcache.is_cacheable(
+                response(status_code=status, cache_control='max-age=60')))
+        self.assertFalse(httpcache.is_cacheable(response(status_code=304)))
+        self.assertTrue(httpcache.is_cacheable(response(status_code=404)))
+
+    def test_vary_headers(self):
+        r = response(vary='User-Agent, accept-encoding,, Accept-Encoding')
+        self.assertEqual(httpcache.vary_headers(r),
+                         ['accept-encoding', 'user-agent'])
+
+
+class FreshnessTest(unittest.TestCase):
+
+    def test_max_age(self):
+        r = response(cache_control='max-age=120')
+        self.assertEqual(httpcache.freshness_lifetime(r), 120)
+
+    def test_s_maxage_wins(self):
+        r = response(cache_control='max-age=120, s-maxage=30')
+        self.assertEqual(httpcache.freshness_lifetime(r), 30)
+
+    def test_no_cache(self):
+        r = response(cache_control='no-cache, max-age=120')
+        self.assertEqual(httpcache.freshness_lifetime(r), 0)
+
+    def test_expires(self):
+        r = response(date=formatdate(NOW), expires=formatdate(NOW + 90))
+        self.assertEqual(httpcache.freshness_lifetime(r), 90)
+        r = response(date=formatdate(NOW), expires='0')
+        self.assertEqual(httpcache.freshness_lifetime(r), 0)
+
+    def test_heuristic(self):
+        r = response(date=formatdate(NOW),
+                     last_modified=formatdate(NOW - 1000))
+        self.assertEqual(httpcache.freshness_lifetime(r), 100)
+        r = response(date=formatdate(NOW),
+                     last_modified=formatdate(NOW - 10 ** 7))
+        self.assertEqual(httpcache.freshness_lifetime(r),
+                         httpcache.MAX_HEURISTIC_LIFETIME)
+
+    def test_default(self):
+        self.assertEqual(httpcache.freshness_lifetime(response()),
+                         httpcache.DEFAULT_LIFETIME)
+        self.assertEqual(httpcache.freshness_lifetime(
+            response(status_code=404)), httpcache.DEFAULT_LIFETIME)
+
+    def test_no_default_for_other_statuses(self):
+        for status in (201, 302, 307, 400, 503):
+            r = response(status_code=status)
+            self.assertEqual(httpcache.freshness_lifetime(r), 0, status)
+            r = response(status_code=status, date=formatdate(NOW),
+                         last_modified=formatdate(NOW - 1000))
+            self.assertEqual(httpcache.freshness_lifetime(r), 0, status)
+            self.assertEqual(httpcache.stale_window(
+                r, 'stale-if-error', 60), 0)
+        # unless they say
+        r = response(status_code=302, cache_control='max-age=60')
+        self.assertEqual(httpcache.freshness_lifetime(r), 60)
+
+    def test_age(self):
+        r = response(age=30, cache_control='max-age=60')
+        self.assertTrue(httpcache.is_fresh(r, NOW))
+        self.assertEqual(httpcache.staleness(r, NOW), -30)
+        r.headers['Age'] = '40'
+        self.assertFalse(httpcache.is_fresh(r, NOW))
+        self.assertEqual(httpcache.staleness(r, NOW), 10)
+
+
+class StaleWindowTest(unittest.TestCase):
+
+    def window(self, r, directive='stale-while-revalidate', default=60):
+        return httpcache.stale_window(r, directive, default)
+
+    def test_directive(self):
+        r = response(cache_control='max-age=60, stale-while-revalidate=30')
+        self.assertEqual(self.window(r), 30)
+
+    def test_default(self):
+        r = response(cache_control='max-age=60')
+        self.assertEqual(self.window(r), 60)
+        self.assertEqual(self.window(response()), 60)
+
+    def test_must_revalidate(self):
+        for cc in ('must-revalidate', 'proxy-revalidate', 's-maxage=60',
+                   'no-cache', 'no-store'):
+            r = response(cache_control='max-age=60, stale-if-error=30, '
+                                       + cc)
+            self.assertEqual(self.window(r, 'stale-if-error'), 0, cc)
+            self.assertEqual(self.window(r), 0, cc)
+
+    def test_origin_windows_replace_defaults(self):
+        r = response(cache_control='max-age=60, stale-if-error=300')
+        self.assertEqual(self.window(r, 'stale-if-error'), 300)
+        self.assertEqual(self.window(r), 0)
+
+    def test_never_fresh(self):
+        r = response(cache_control='max-age=0')
+        self.assertEqual(self.window(r), 0)
+        r = response(date=formatdate(NOW), expires=formatdate(NOW - 10))
+        self.assertEqual(self.window(r), 0)
+        r = response(cache_control='max-age=0, stale-while-revalidate=30')
+        self.assertEqual(self.window(r), 30)
+
+    def test_may_serve_stale(self):
+        r = response(age=80, cache_control='max-age=60')
+        self.assertTrue(httpcache.may_serve_stale(
+            r, 'stale-while-revalidate', 30, NOW))
+        self.assertFalse(httpcache.may_serve_stale(
+            r, 'stale-while-revalidate', 10, NOW))
+
+
+class RevalidateTest(unittest.TestCase):
+
+    def test_conditional_headers(self):
+        self.assertFalse(httpcache.has_validators(response()))
+        r = response(etag='"abc"', last_modified=formatdate(NOW - 10))
+        self.assertTrue(httpcache.has_validators(r))
+        self.assertEqual(httpcache.conditional_headers(r),
+                         {'If-None-Match': '"abc"',
+                          'If-Modified-Since': formatdate(NOW - 10)})
+
+    def test_refresh(self):
+        cached = response(age=600, etag='"abc"', content_length='5',
+                          cache_control='max-age=60')
+        not_modified = Response(status_code=304, timestamp=NOW,
+                                response_time=0.1,
+                                headers={'Cache-Control': 'max-age=120',
+                                         'Content-Length': '0'})
+        refreshed = httpcache.refresh(cached, not_modified)
+        self.assertEqual(refreshed.timestamp, NOW)
+        self.assertEqual(refreshed.headers['Cache-Control'], 'max-age=120')
+        self.assertEqual(refreshed.headers['content-length'], '5')
+        self.assertEqual(refreshed.headers['etag'], '"abc"')
+        self.assertTrue(httpcache.is_fresh(refreshed, NOW + 60))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import os
+import subprocess
+import sys
+import unittest
+
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+import memcache
+from tests.memcached import FakeMemcached
+
+
+class MultiCallTest(unittest.TestCase):
+
+    protocol = 'text'
+    pooled = False
+
+    def setUp(self):
+        self.servers = [FakeMemcached(), FakeMemcached()]
+        self.mc = self.client()
+
+    def tearDown(self):
+        self.mc.disconnect_all()
+        for server in self.servers:
+            server.stop()
+
+    def client(self):
+        return memcache.Client([s.address for s in self.servers],
+                               protocol=self.protocol, pooled=self.pooled,
+                               distribution='ketama')
+
+    def keys(self, n=40):
+        return dict(('key%s' % i, 'value %s' % i) for i in xrange(n))
+
+    def test_get_multi(self):
+        values = self.keys()
+        self.assertEqual(self.mc.set_multi(values), [])
+        self.assertEqual(self.mc.get_multi(values.keys() + ['missing']),
+                         values)
+
+    def test_get_multi_w_a_server_down(self):
+        values = self.keys()
+        self.mc.set_multi(values)
+        self.servers[0].stop()
+
+        found = self.mc.get_multi(values.keys())
+        # the live server's keys are still found, the other's miss
+        self.assertTrue(found)
+        self.assertTrue(len(found) < len(values))
+        for key, value in found.iteritems():
+            self.assertEqual(values[key], value)
+
+    def test_set_multi_w_a_server_down(self):
+        values = self.keys()
+        self.mc.get_multi(values.keys())
+        self.servers[1].stop()
+        # the down server's keys are either not stored or moved to
+        # the one still up, what was stored can be had back
+        notstored = self.mc.set_multi(values)
+        self.assertEqual(sorted(self.mc.get_multi(values.keys())),
+                         sorted(set(values) - set(notstored)))
+
+    def test_noreply_set(self):
+        self.assertEqual(self.mc.set('key', 'value', noreply=True), 1)
+        self.assertEqual(self.mc.get('key'), 'value')
+        self.assertEqual(self.mc.set_multi(self.keys(), noreply=True), [])
+        self.assertEqual(self.mc.get_multi(self.keys().keys()), self.keys())
+
+    def restart(self):
+        """ both memcacheds go away w/ noreply replies still owed """
+        self.mc.set_multi(self.keys(), noreply=True)
+        for i, server in enumerate(self.servers):
+            server.stop()
+            self.servers[i] = FakeMemcached(server.port)
+
+    def revive(self):
+        for server in self.mc.servers:
+            server.deaduntil = 0
+
+    def test_get_multi_after_restart(self):
+        self.restart()
+        # the old connections are gone, it's a miss not a traceback
+        self.assertEqual(self.mc.get_multi(self.keys().keys()), {})
+        self.revive()
+        self.assertEqual(self.mc.set_multi(self.keys()), [])
+        self.assertEqual(self.mc.get_multi(self.keys().keys()), self.keys())
+
+    def test_set_multi_after_restart(self):
+        self.restart()
+        self.assertEqual(sorted(self.mc.set_multi(self.keys())),
+                         sorted(self.keys()))
+        self.revive()
+        self.assertEqual(self.mc.set_multi(self.keys()), [])
+
+    def test_delete_multi_after_restart(self):
+        self.restart()
+        self.assertEqual(self.mc.delete_multi(self.keys().keys()), 0)
+        self.revive()
+        self.assertEqual(self.mc.delete_multi(self.keys().keys()), 1)
+
+class BufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeMemcached()
+        self.mc = memcache.Client([self.server.address], pooled=True,
+                                  server_max_value_length=0)
+        self.host = self.mc.servers[0]
+
+    def tearDown(self):
+        self.mc.disconnect_all()
+        self.server.stop()
+
+    def idle_buffer(self):
+        return self.host.pool.idle[-1][3]
+
+    def test_buffer_is_reused(self):
+        self.mc.set('key', 'value')
+        rbuf = self.idle_buffer()
+        for i in xrange(3):
+            self.assertEqual(self.mc.get('key'), 'value')
+            self.assertTrue(self.idle_buffer() is rbuf)
+
+    def test_buffer_goes_back_w_the_connection(self):
+        self.assertEqual(len(self.host.rbuf), 0)
+        self.mc.set('key', 'value')
+        self.assertEqual(len(self.host.rbuf), 0)
+        self.assertEqual(len(self.idle_buffer()), self.host._RECV_SIZE)
+
+        # another client (a thread's or greenlet's) picks it up
+        other = memcache.Client([self.server.address], pooled=True,
+                                server_max_value_length=0)
+        rbuf = self.idle_buffer()
+        self.assertEqual(other.get('key'), 'value')
+        self.assertTrue(self.idle_buffer() is rbuf)
+
+    def test_big_buffer_is_dropped(self):
+        self.host._MAX_KEPT_BUFFER = 128 * 1024
+        value = 'x' * 256 * 1024
+        self.mc.set('key', value)
+        self.assertEqual(self.mc.get_multi(['key', 'other']),
+                         {'key': value})
+        self.assertEqual(len(self.idle_buffer()), self.host._RECV_SIZE)
+
+    def test_unpooled_buffer_is_kept(self):
+        mc = memcache.Client([self.server.address])
+        host = mc.servers[0]
+        mc.set('key', 'value')
+        rbuf = host.rbuf
+        self.assertEqual(len(rbuf), host._RECV_SIZE)
+        self.assertEqual(mc.get('key'), 'value')
+        self.assertTrue(host.rbuf is rbuf)
+        mc.disconnect_all()
+
+    def test_ring_is_shared(self):
+        servers = [self.server.address, '127.0.0.1:1']
+        a = memcache.Client(servers, distribution='ketama')
+        b = memcache.Client(servers, distribution='ketama')
+        self.assertTrue(a.ketama_points is b.ketama_points)
+        self.assertEqual([s.name() for s in a.ketama_servers],
+                         [s.name() for s in b.ketama_servers])
+        self.assertTrue(set(b.ketama_servers) <= set(b.servers))
+
+
+@unittest.skipIf(gevent is None, 'needs gevent')
+class GreenletTest(unittest.TestCase):
+    """
+    after patch_all the client is local to each greenlet, so each one
+    builds it's own. runs in a process of it's own to be patched
+    """
+
+    script = '''
+from gevent import monkey
+monkey.patch_all()
+import sys
+import gevent
+import memcache
+
+mc = memcache.Client([sys.argv[1]], pooled=True, pool_max_size=8,
+                     distribution='ketama')
+
+def work(i):
+    mc.set('key%s' % i, 'value %s' % i)
+    assert mc.get('key%s' % i) == 'value %s' % i
+    return mc.servers, mc.ketama_points
+
+results = [g.get() for g in gevent.joinall(
+    [gevent.spawn(work, i) for i in xrange(500)], raise_error=True)]
+hosts = set(id(h) for servers, points in results for h in servers)
+assert len(hosts) == 500, len(hosts)
+assert all(not h.rbuf for servers, points in results for h in servers)
+assert len(set(id(points) for servers, points in results)) == 1
+print 'ok'
+'''
+
+    def test_client_per_greenlet(self):
+        server = FakeMemcached()
+        try:
+            out = subprocess.check_output(
+                [sys.executable, '-c', self.script, server.address],
+                cwd=os.path.dirname(os.path.dirname(__file__)) or '.')
+        finally:
+            server.stop()
+        self.assertEqual(out.strip(), 'ok')
+
+
+class MetaMultiCallTest(MultiCallTest):
+    protocol = 'meta'
+
+
+class PooledMetaMultiCallTest(MultiCallTest):
+    protocol = 'meta'
+    pooled = True
+
+
+if __name__ == '__main__':
+    unittest.main()
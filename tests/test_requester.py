@@ -0,0 +1,273 @@
+import threading
+import unittest
+from time import sleep
+
+import fakeredis
+
+import handlers.requester as requester
+from tgen.requester import ttypes as o
+from tests.memcached import FakeMemcached
+from tests.origin import Origin
+
+
+class TestHandler(requester.MatureRequestHandler):
+    fetch_workers = 8
+
+
+class HandlerTest(unittest.TestCase):
+
+    handler_class = TestHandler
+
+    def setUp(self):
+        self.redis = requester.Redis
+        requester.Redis = lambda *a: fakeredis.FakeStrictRedis()
+        fakeredis.FakeStrictRedis().flushall()
+
+        self.origin = Origin()
+        self.memcached = FakeMemcached()
+        self.handler = self.handler_class(memcache_host='127.0.0.1',
+                                          memcache_port=self.memcached.port)
+
+    def tearDown(self):
+        requester.Redis = self.redis
+        self.handler.mc.disconnect_all()
+        self.memcached.stop()
+        self.origin.stop()
+
+    def request(self, path='/', method='GET', **kwargs):
+        return o.Request(url=self.origin.url + path, method=method, **kwargs)
+
+    def urlopen(self, path='/', method='GET', **kwargs):
+        return self.handler.urlopen(self.request(path, method, **kwargs))
+
+
+class CacheKeyTest(HandlerTest):
+
+    def key(self, **kwargs):
+        return self.handler.get_cache_key(self.request(**kwargs))
+
+    def test_method_and_data(self):
+        self.assertNotEqual(self.key(), self.key(method='POST'))
+        self.assertEqual(self.key(method='get'), self.key())
+        self.assertNotEqual(self.key(data={'a': '1'}), self.key())
+
+    def test_data_is_escaped(self):
+        self.assertNotEqual(self.key(data={'a': '1&b=2'}),
+                            self.key(data={'a': '1', 'b': '2'}))
+        self.assertEqual(self.key(data={'b': '2', 'a': '1'}),
+                         self.key(data={'a': '1', 'b': '2'}))
+
+
+class MethodTest(HandlerTest):
+
+    def test_get_is_cached(self):
+        self.assertFalse(self.urlopen('/a').from_cache)
+        self.assertTrue(self.urlopen('/a').from_cache)
+        self.assertEqual(len(self.origin.hits()), 1)
+
+    def test_post_always_goes_live(self):
+        for i in xrange(2):
+            response = self.urlopen('/form', 'POST')
+            self.assertFalse(response.from_cache)
+        self.assertEqual(len(self.origin.hits('POST')), 2)
+
+    def test_post_drops_the_cached_get(self):
+        self.urlopen('/a')
+        self.assertTrue(self.urlopen('/a').from_cache)
+        self.urlopen('/a', 'DELETE')
+        self.assertFalse(self.urlopen('/a').from_cache)
+        self.assertEqual(len(self.origin.hits('GET')), 2)
+
+    def test_multi(self):
+        self.urlopen('/a')
+        self.urlopen('/a', 'HEAD')
+        results = self.handler.urlopen_multi(
+            [self.request('/a'), self.request('/a', 'POST'),
+             self.request('/a', 'HEAD')])
+        self.assertEqual([r.response.from_cache for r in results],
+                         [True, None, True])
+        self.assertEqual(len(self.origin.hits('POST')), 1)
+
+
+class CoalesceTest(HandlerTest):
+
+    def slow(self, path):
+        started = threading.Event()
+        def content():
+            started.set()
+            sleep(0.3)
+            return 'hello'
+        self.origin.respond(path, 200, {'Cache-Control': 'max-age=60'},
+                            content)
+        return started
+
+    def concurrently(self, *requests):
+        futures = [self.handler._submit_fetch(r) for r in requests]
+        return [f.result(5) for f in futures]
+
+    def test_gets_share_a_fetch(self):
+        self.slow('/a')
+        self.concurrently(self.request('/a'), self.request('/a'))
+        self.assertEqual(len(self.origin.hits('GET')), 1)
+
+    def test_posts_each_go_live(self):
+        self.slow('/form')
+        self.concurrently(self.request('/form', 'POST'),
+                          self.request('/form', 'POST'))
+        self.assertEqual(len(self.origin.hits('POST')), 2)
+
+    def test_posts_skip_the_cross_process_lock(self):
+        self.handler.coalesce_across_processes = True
+        started = self.slow('/form')
+        other = self.handler_class(memcache_host='127.0.0.1',
+                                   memcache_port=self.memcached.port)
+        other.coalesce_across_processes = True
+        request = self.request('/form', 'POST')
+        future = other._submit_fetch(request)
+        started.wait(5)
+        lock_key = '%s:lock' % other.get_cache_key(request)
+        self.assertEqual(self.handler.mc.get(lock_key), None)
+        self.concurrently(request)
+        future.result(5)
+        self.assertEqual(len(self.origin.hits('POST')), 2)
+        other.mc.disconnect_all()
+
+
+class StatusTest(HandlerTest):
+
+    def test_errors_are_not_cached(self):
+        self.origin.respond('/a', 503)
+        self.assertEqual(self.urlopen('/a').status_code, 503)
+        self.origin.respond('/a', 200)
+        response = self.urlopen('/a')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.from_cache)
+
+    def test_an_error_leaves_the_cached_copy(self):
+        self.origin.respond('/a', 200, {'Cache-Control': 'max-age=60'})
+        self.urlopen('/a')
+        self.origin.respond('/a', 503)
+        self.handler.urlopen(self.request('/a', no_cache=True))
+        self.assertTrue(self.urlopen('/a').from_cache)
+
+    def test_private_is_not_cached(self):
+        self.origin.respond('/a', 200, {'Cache-Control': 'private'})
+        self.urlopen('/a')
+        self.assertFalse(self.urlopen('/a').from_cache)
+
+
+class SplitTest(HandlerTest):
+
+    def body_ttl(self):
+        ttls = [ttl for key, ttl in self.memcached.ttls.iteritems()
+                if key.startswith('httpbody:')]
+        self.assertEqual(len(ttls), 1)
+        return ttls[0]
+
+    def test_body_lives_as_long_as_the_metadata(self):
+        response = self.urlopen('/a')
+        self.assertEqual(self.body_ttl(),
+                         self.handler.get_cache_ttl(response))
+        self.assertTrue(self.body_ttl() < self.handler.max_cache_ttl)
+
+    def test_refresh_extends_the_body(self):
+        self.urlopen('/a')
+        response = self.urlopen('/a')
+        response.headers = {'Cache-Control': 'max-age=86400'}
+        ttl = self.handler.get_cache_ttl(response)
+        self.assertTrue(ttl > self.body_ttl())
+
+        refreshed = self.handler.refresh_cache(self.request('/a'), response)
+        self.assertEqual(refreshed.content, 'hello')
+        self.assertEqual(self.body_ttl(), ttl)
+
+
+class StreamHandler(TestHandler):
+    stream_idle_timeout = 0.2
+    stream_sweep_interval = 0.05
+
+
+class StreamTest(HandlerTest):
+
+    handler_class = StreamHandler
+    body = ''.join('%06d' % i for i in xrange(50000))
+
+    def setUp(self):
+        HandlerTest.setUp(self)
+        self.origin.respond('/a', 200, {}, self.body)
+
+    def open(self):
+        return self.handler.urlopen_stream(self.request('/a')).stream_id
+
+    def test_idle_stream_is_closed(self):
+        stream_id = self.open()
+        self.handler.read_stream(stream_id, 10)
+        sleep(0.5)
+        # w/o another stream opening
+        self.assertFalse(stream_id in self.handler.streams)
+        self.assertRaises(o.Exception, self.handler.read_stream,
+                          stream_id, 10)
+
+    def test_read_stream_is_not_idle(self):
+        stream_id = self.open()
+        for i in xrange(5):
+            sleep(0.1)
+            self.handler.read_stream(stream_id, 10)
+
+    def test_concurrent_reads(self):
+        stream_id = self.open()
+        chunks = []
+        def read():
+            while True:
+                try:
+                    chunk = self.handler.read_stream(stream_id, 1000)
+                except o.Exception:
+                    return
+                chunks.append(chunk.data)
+                if chunk.eof:
+                    return
+        threads = [threading.Thread(target=read) for i in xrange(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(sum(len(c) for c in chunks), len(self.body))
+        self.assertEqual(sorted(c for c in chunks if c),
+                         sorted(self.body[i:i + 1000]
+                                for i in xrange(0, len(self.body), 1000)))
+
+
+class CompressionTest(HandlerTest):
+
+    body = 'hello ' * 1000
+
+    def setUp(self):
+        HandlerTest.setUp(self)
+        self.origin.respond('/a', 200, {'Cache-Control': 'max-age=60'},
+                            self.body)
+
+    def test_missing_codec_falls_back_to_zlib(self):
+        class SnappyHandler(TestHandler):
+            cache_codec = 'snappy-which-isnt-installed'
+        handler = SnappyHandler(memcache_host='127.0.0.1',
+                                memcache_port=self.memcached.port)
+        self.assertEqual(handler.cache_codec, 'zlib')
+        self.assertEqual(handler.urlopen(self.request('/a')).content,
+                         self.body)
+        handler.mc.disconnect_all()
+
+    def test_damaged_body_is_a_miss(self):
+        self.urlopen('/a')
+        for key, (flags, value) in self.memcached.data.items():
+            if key.startswith('httpbody:'):
+                self.memcached.data[key] = (flags, value[:20])
+        self.handler.l1.clear()
+
+        response = self.urlopen('/a')
+        self.assertFalse(response.from_cache)
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(len(self.origin.hits()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import socket
+import struct
+import threading
+import unittest
+from time import sleep
+
+from thrift.transport import TSocket
+
+from lib.server import BoundedNonblockingServer
+
+
+class SlowProcessor(object):
+    """ answers 'ok' to any call once it's let go """
+
+    def __init__(self):
+        self.go = threading.Event()
+
+    def process(self, iprot, oprot):
+        self.go.wait(5)
+        oprot.trans.write('ok')
+
+
+class BoundedNonblockingServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = SlowProcessor()
+        self.server = BoundedNonblockingServer(
+            self.processor, TSocket.TServerSocket('127.0.0.1', 0),
+            threads=1, queue_size=1)
+        self.server.prepare()
+        self.port = self.server.socket.handle.getsockname()[1]
+        self.serving = threading.Thread(target=self.server.serve)
+        self.serving.daemon = True
+        self.serving.start()
+        self.clients = []
+
+    def tearDown(self):
+        self.processor.go.set()
+        self.server.stop()
+        self.serving.join(5)
+        self.server.close()
+        for client in self.clients:
+            client.close()
+
+    def call(self):
+        client = socket.create_connection(('127.0.0.1', self.port))
+        client.sendall(struct.pack('!i', 4) + 'call')
+        self.clients.append(client)
+        return client
+
+    def answer(self, client):
+        client.settimeout(5)
+        data = ''
+        while len(data) < 6:
+            data += client.recv(6 - len(data))
+        return data
+
+    def test_loop_keeps_running_when_full(self):
+        for i in xrange(4):
+            self.call()
+            sleep(0.1)
+        self.assertEqual(self.server.tasks.qsize(), 1)
+        # a put on a full queue would have the loop stuck till a worker
+        # frees up
+        self.server.stop()
+        self.serving.join(1)
+        self.assertFalse(self.serving.is_alive())
+
+    def test_every_call_is_answered(self):
+        clients = [self.call() for i in xrange(4)]
+        sleep(0.2)
+        self.processor.go.set()
+        for client in clients:
+            self.assertEqual(self.answer(client), struct.pack('!i', 2) + 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import unittest
+
+from lib.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = []
+        self.release = threading.Event()
+
+    def work(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        return value
+
+    def test_do(self):
+        self.release.set()
+        self.assertEqual(self.flights.do('key', self.work, 1), 1)
+        self.assertEqual(self.flights.in_flight(), 0)
+
+    def test_concurrent_calls_share_one(self):
+        future, leader = self.flights.join('key')
+        joined = [self.flights.join('key') for i in xrange(10)]
+        self.assertTrue(leader)
+        self.assertEqual(joined, [(future, False)] * 10)
+
+        results = []
+        threads = [threading.Thread(target=lambda f=f: results.append(
+                       f.result(5))) for f, leader in joined]
+        for t in threads:
+            t.start()
+        self.release.set()
+        self.assertEqual(self.flights.run('key', future, self.work, 1), 1)
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(self.flights.in_flight(), 0)
+
+    def test_keys_fly_alone(self):
+        self.release.set()
+        self.flights.do('a', self.work, 1)
+        self.flights.do('b', self.work, 2)
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_exception_goes_to_everyone(self):
+        future, leader = self.flights.join('key')
+        follower, follows = self.flights.join('key')
+        self.assertTrue(leader)
+        self.assertFalse(follows)
+        self.assertTrue(follower is future)
+
+        def fail():
+            raise ValueError('nope')
+        self.assertRaises(ValueError, self.flights.run, 'key', future, fail)
+        self.assertRaises(ValueError, follower.result, 0)
+        self.assertEqual(self.flights.in_flight(), 0)
+
+    def test_flight_lands_before_waiters_wake(self):
+        future, leader = self.flights.join('key')
+        landed = []
+        def watch():
+            future.result()
+            landed.append(self.flights.join('key')[1])
+        t = threading.Thread(target=watch)
+        t.start()
+        self.release.set()
+        self.flights.run('key', future, self.work, 1)
+        t.join()
+        # coming right back for the key is a new flight
+        self.assertEqual(landed, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from time import time
+
+import fakeredis
+
+from lib import hostlimiter, tokenbucket
+from lib.hostlimiter import HostRateLimiter
+from lib.tokenbucket import LeasedRateLimiter
+
+HOST = 'example.com'
+LIMIT = 1000000
+
+
+class LeasedRateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rc = fakeredis.FakeStrictRedis()
+        self.rc.flushall()
+        self.rl = HostRateLimiter(self.rc, 'test', (LIMIT, 60), (1000, 60))
+
+    def limiter(self, **kwargs):
+        # we sync by hand
+        kwargs.setdefault('sync_interval', 3600)
+        kwargs.setdefault('lease_ttl', 3600)
+        return LeasedRateLimiter(self.rl, **kwargs)
+
+    def used(self):
+        size, requests = self.rl.remaining(HOST)
+        return LIMIT - size, 1000 - requests
+
+    def test_lease_is_reserved(self):
+        local = self.limiter(lease_size=1000)
+        self.assertEqual(local.allowed(HOST), 1000)
+        self.assertEqual(self.used(), (1000, 10))
+        # working from the lease doesn't touch redis
+        local.consume(HOST, 400)
+        self.assertEqual(local.allowed(HOST), 600)
+        self.assertEqual(self.used(), (1000, 10))
+
+    def test_lease_is_a_fraction_of_what_is_left(self):
+        local = self.limiter(lease_fraction=0.5)
+        self.rl.add(HOST, LIMIT - 1000, 0)
+        self.assertEqual(local.allowed(HOST), 500)
+        self.assertEqual(local.leases[HOST][1], 10)
+
+    def test_unused_lease_is_handed_back(self):
+        local = self.limiter(lease_size=1000)
+        local.allowed(HOST)
+        local.consume(HOST, 400)
+        local.leases[HOST][2] = 0
+        local.sync()
+        self.assertEqual(self.used(), (400, 1))
+        self.assertFalse(local.leases)
+
+    def test_release(self):
+        local = self.limiter(lease_size=1000)
+        local.allowed(HOST)
+        local.consume(HOST, 100)
+        local.sync()
+        self.assertEqual(self.used(), (1000, 10))
+        local.sync(release=True)
+        self.assertEqual(self.used(), (100, 1))
+
+    def test_overshoot_is_counted(self):
+        local = self.limiter(lease_size=1000)
+        local.allowed(HOST)
+        local.consume(HOST, 5000)
+        self.assertEqual(local.allowed(HOST), 1000)
+        local.sync(release=True)
+        self.assertEqual(self.used(), (5000, 1))
+
+    def test_usage_wo_a_lease(self):
+        local = self.limiter()
+        local.consume(HOST, 300)
+        local.sync()
+        self.assertEqual(self.used(), (300, 1))
+
+    def test_limiters_share_the_limit(self):
+        limiters = [self.limiter(lease_requests=1000) for i in xrange(4)]
+        consumed = 0
+        while True:
+            pulled = 0
+            for local in limiters:
+                size = local.allowed(HOST)
+                local.consume(HOST, size)
+                pulled += size
+            if not pulled:
+                break
+            consumed += pulled
+        self.assertEqual(consumed, LIMIT)
+        for local in limiters:
+            local.sync(release=True)
+        self.assertEqual(self.used()[0], LIMIT)
+
+    def test_out_of_requests(self):
+        local = self.limiter(lease_size=1000)
+        self.rl.add(HOST, 0, 1000)
+        self.assertEqual(local.allowed(HOST), 0)
+        self.assertEqual(self.used(), (0, 1000))
+
+
+class Clock(object):
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RefundTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.patched = [hostlimiter, tokenbucket]
+        for module in self.patched:
+            module.time = self.clock
+
+        self.rc = fakeredis.FakeStrictRedis()
+        self.rc.flushall()
+        self.rl = HostRateLimiter(self.rc, 'test', (LIMIT, 10), (1000, 10))
+        self.local = LeasedRateLimiter(self.rl, lease_size=200000,
+                                       lease_requests=10, lease_ttl=1,
+                                       sync_interval=3600, lease_fraction=1)
+
+    def tearDown(self):
+        for module in self.patched:
+            module.time = time
+
+    def test_refund_goes_to_the_leases_bucket(self):
+        self.local.allowed(HOST)
+        self.local.consume(HOST, 50000)
+        self.clock.now += 5
+        self.local.sync()
+        self.assertEqual(self.rl.remaining(HOST), (LIMIT - 50000, 999))
+        # the usage leaves the window w/ the bucket it was in
+        self.clock.now += 6
+        self.assertEqual(self.rl.remaining(HOST), (LIMIT, 1000))
+
+    def test_no_refund_past_the_window(self):
+        self.local.allowed(HOST)
+        self.clock.now += 11
+        self.local.sync()
+        self.assertEqual(self.rl.remaining(HOST), (LIMIT, 1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
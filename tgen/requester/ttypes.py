@@ -215,6 +215,8 @@ class Response:
    - response_time
    - timestamp
    - cookies
+   - truncated
+   - stream_id
   """
 
   thrift_spec = (
@@ -227,9 +229,11 @@ class Response:
     (6, TType.DOUBLE, 'response_time', None, None, ), # 6
     (7, TType.DOUBLE, 'timestamp', None, None, ), # 7
     (8, TType.MAP, 'cookies', (TType.STRING,None,TType.STRING,None), None, ), # 8
+    (9, TType.BOOL, 'truncated', None, None, ), # 9
+    (10, TType.STRING, 'stream_id', None, None, ), # 10
   )
 
-  def __init__(self, url=None, status_code=None, headers=None, content=None, from_cache=None, response_time=None, timestamp=None, cookies=None,):
+  def __init__(self, url=None, status_code=None, headers=None, content=None, from_cache=None, response_time=None, timestamp=None, cookies=None, truncated=None, stream_id=None,):
     self.url = url
     self.status_code = status_code
     self.headers = headers
@@ -238,6 +242,8 @@ class Response:
     self.response_time = response_time
     self.timestamp = timestamp
     self.cookies = cookies
+    self.truncated = truncated
+    self.stream_id = stream_id
 
   def read(self, iprot):
     if iprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated and isinstance(iprot.trans, TTransport.CReadableTransport) and self.thrift_spec is not None and fastbinary is not None:
@@ -300,6 +306,16 @@ class Response:
           iprot.readMapEnd()
         else:
           iprot.skip(ftype)
+      elif fid == 9:
+        if ftype == TType.BOOL:
+          self.truncated = iprot.readBool();
+        else:
+          iprot.skip(ftype)
+      elif fid == 10:
+        if ftype == TType.STRING:
+          self.stream_id = iprot.readString();
+        else:
+          iprot.skip(ftype)
       else:
         iprot.skip(ftype)
       iprot.readFieldEnd()
@@ -350,6 +366,170 @@ class Response:
         oprot.writeString(viter35)
       oprot.writeMapEnd()
       oprot.writeFieldEnd()
+    if self.truncated != None:
+      oprot.writeFieldBegin('truncated', TType.BOOL, 9)
+      oprot.writeBool(self.truncated)
+      oprot.writeFieldEnd()
+    if self.stream_id != None:
+      oprot.writeFieldBegin('stream_id', TType.STRING, 10)
+      oprot.writeString(self.stream_id)
+      oprot.writeFieldEnd()
+    oprot.writeFieldStop()
+    oprot.writeStructEnd()
+    def validate(self):
+      return
+
+
+  def __repr__(self):
+    L = ['%s=%r' % (key, value)
+      for key, value in self.__dict__.iteritems()]
+    return '%s(%s)' % (self.__class__.__name__, ', '.join(L))
+
+  def __eq__(self, other):
+    return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+
+  def __ne__(self, other):
+    return not (self == other)
+
+class StreamChunk:
+  """
+  Attributes:
+   - stream_id
+   - data
+   - eof
+  """
+
+  thrift_spec = (
+    None, # 0
+    (1, TType.STRING, 'stream_id', None, None, ), # 1
+    (2, TType.STRING, 'data', None, None, ), # 2
+    (3, TType.BOOL, 'eof', None, None, ), # 3
+  )
+
+  def __init__(self, stream_id=None, data=None, eof=None,):
+    self.stream_id = stream_id
+    self.data = data
+    self.eof = eof
+
+  def read(self, iprot):
+    if iprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated and isinstance(iprot.trans, TTransport.CReadableTransport) and self.thrift_spec is not None and fastbinary is not None:
+      fastbinary.decode_binary(self, iprot.trans, (self.__class__, self.thrift_spec))
+      return
+    iprot.readStructBegin()
+    while True:
+      (fname, ftype, fid) = iprot.readFieldBegin()
+      if ftype == TType.STOP:
+        break
+      if fid == 1:
+        if ftype == TType.STRING:
+          self.stream_id = iprot.readString();
+        else:
+          iprot.skip(ftype)
+      elif fid == 2:
+        if ftype == TType.STRING:
+          self.data = iprot.readString();
+        else:
+          iprot.skip(ftype)
+      elif fid == 3:
+        if ftype == TType.BOOL:
+          self.eof = iprot.readBool();
+        else:
+          iprot.skip(ftype)
+      else:
+        iprot.skip(ftype)
+      iprot.readFieldEnd()
+    iprot.readStructEnd()
+
+  def write(self, oprot):
+    if oprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated and self.thrift_spec is not None and fastbinary is not None:
+      oprot.trans.write(fastbinary.encode_binary(self, (self.__class__, self.thrift_spec)))
+      return
+    oprot.writeStructBegin('StreamChunk')
+    if self.stream_id != None:
+      oprot.writeFieldBegin('stream_id', TType.STRING, 1)
+      oprot.writeString(self.stream_id)
+      oprot.writeFieldEnd()
+    if self.data != None:
+      oprot.writeFieldBegin('data', TType.STRING, 2)
+      oprot.writeString(self.data)
+      oprot.writeFieldEnd()
+    if self.eof != None:
+      oprot.writeFieldBegin('eof', TType.BOOL, 3)
+      oprot.writeBool(self.eof)
+      oprot.writeFieldEnd()
+    oprot.writeFieldStop()
+    oprot.writeStructEnd()
+    def validate(self):
+      return
+
+
+  def __repr__(self):
+    L = ['%s=%r' % (key, value)
+      for key, value in self.__dict__.iteritems()]
+    return '%s(%s)' % (self.__class__.__name__, ', '.join(L))
+
+  def __eq__(self, other):
+    return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+
+  def __ne__(self, other):
+    return not (self == other)
+
+class BatchResponse:
+  """
+  Attributes:
+   - response
+   - ex
+  """
+
+  thrift_spec = (
+    None, # 0
+    (1, TType.STRUCT, 'response', (Response, Response.thrift_spec), None, ), # 1
+    (2, TType.STRUCT, 'ex', (Exception, Exception.thrift_spec), None, ), # 2
+  )
+
+  def __init__(self, response=None, ex=None,):
+    self.response = response
+    self.ex = ex
+
+  def read(self, iprot):
+    if iprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated and isinstance(iprot.trans, TTransport.CReadableTransport) and self.thrift_spec is not None and fastbinary is not None:
+      fastbinary.decode_binary(self, iprot.trans, (self.__class__, self.thrift_spec))
+      return
+    iprot.readStructBegin()
+    while True:
+      (fname, ftype, fid) = iprot.readFieldBegin()
+      if ftype == TType.STOP:
+        break
+      if fid == 1:
+        if ftype == TType.STRUCT:
+          self.response = Response()
+          self.response.read(iprot)
+        else:
+          iprot.skip(ftype)
+      elif fid == 2:
+        if ftype == TType.STRUCT:
+          self.ex = Exception()
+          self.ex.read(iprot)
+        else:
+          iprot.skip(ftype)
+      else:
+        iprot.skip(ftype)
+      iprot.readFieldEnd()
+    iprot.readStructEnd()
+
+  def write(self, oprot):
+    if oprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated and self.thrift_spec is not None and fastbinary is not None:
+      oprot.trans.write(fastbinary.encode_binary(self, (self.__class__, self.thrift_spec)))
+      return
+    oprot.writeStructBegin('BatchResponse')
+    if self.response != None:
+      oprot.writeFieldBegin('response', TType.STRUCT, 1)
+      self.response.write(oprot)
+      oprot.writeFieldEnd()
+    if self.ex != None:
+      oprot.writeFieldBegin('ex', TType.STRUCT, 2)
+      self.ex.write(oprot)
+      oprot.writeFieldEnd()
     oprot.writeFieldStop()
     oprot.writeStructEnd()
     def validate(self):